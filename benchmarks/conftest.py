@@ -0,0 +1,108 @@
+import functools
+import json
+
+import pandas as pd
+import pytest
+
+from bokeh.embed import json_item
+from pathlib import Path
+
+from ptplot.testing import BALL_NAME, generate_tracking_data
+
+
+NOTEBOOK_DIR = Path(__file__).parent.parent / "notebooks"
+PLAY_COUNTS = [1, 10, 100, 1000]
+FRAMES_PER_PLAY = 300  # About the length of the example plays in the notebooks
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--max-plays",
+        type=int,
+        default=10,
+        help="Only run benchmarks using at most this many plays (larger ones can take many minutes)",
+    )
+
+
+def pytest_sessionstart(session):
+    # On the first run there are no saved results to compare against, so rather than erroring out
+    # when a regression threshold is set, just record the results as the baseline for later runs.
+    benchmark_session = getattr(session.config, "_benchmarksession", None)
+    if benchmark_session is not None and benchmark_session.compare_fail and not benchmark_session.compared_mapping:
+        benchmark_session.compare_fail = []
+
+
+def pytest_collection_modifyitems(config, items):
+    max_plays = config.getoption("--max-plays")
+    skip = pytest.mark.skip(reason=f"uses more than {max_plays} plays (see --max-plays)")
+    for item in items:
+        callspec = getattr(item, "callspec", None)
+        if callspec is not None and callspec.params.get("num_plays", 0) > max_plays:
+            item.add_marker(skip)
+
+
+@functools.lru_cache(maxsize=None)
+def _bundled_plays():
+    plays = []
+    for path in sorted(NOTEBOOK_DIR.glob("*.tsv")):
+        play = pd.read_csv(path, sep="\t")
+        is_ball = play["displayName"] == BALL_NAME
+        play.loc[is_ball, "teamAbbr"] = "ball"
+        play.loc[is_ball, "jerseyNumber"] = ""
+        play.loc[is_ball, "nflId"] = 0
+        plays.append(play)
+    return plays
+
+
+@functools.lru_cache(maxsize=None)
+def _load_plays(num_plays):
+    """Build a dataset with the given number of plays by cycling through copies of the bundled plays,
+    giving each copy its own play and player ids."""
+    bundled_plays = _bundled_plays()
+    plays = []
+    for play_number in range(num_plays):
+        play = bundled_plays[play_number % len(bundled_plays)].copy()
+        play["playId"] = play_number
+        play["nflId"] = play["nflId"] + play_number * 10_000_000
+        plays.append(play)
+    return pd.concat(plays, ignore_index=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _generate_plays(num_plays):
+    """Build a dataset with the given number of synthetic plays, in the same form as _load_plays."""
+    data = generate_tracking_data(num_plays=num_plays, num_frames=FRAMES_PER_PLAY, seed=0)
+    is_ball = data["displayName"] == BALL_NAME
+    data.loc[is_ball, "teamAbbr"] = "ball"
+    data.loc[is_ball, "jerseyNumber"] = ""
+    data["nflId"] = data["nflId"].fillna(0) + data["playId"] * 10_000_000
+    return data
+
+
+@pytest.fixture(scope="function", params=PLAY_COUNTS)
+def num_plays(request):
+    return request.param
+
+
+@pytest.fixture(scope="function", params=["bundled", "synthetic"])
+def data_source(request):
+    return request.param
+
+
+@pytest.fixture(scope="function")
+def tracking_data(data_source, num_plays):
+    return _load_plays(num_plays) if data_source == "bundled" else _generate_plays(num_plays)
+
+
+@pytest.fixture(scope="function")
+def benchmark_draw(benchmark, num_plays):
+    """Time drawing a freshly built plot, and record how large the resulting Bokeh document is."""
+    rounds = 5 if num_plays <= 10 else (3 if num_plays <= 100 else 1)
+
+    def run(build_plot):
+        plot_grid = benchmark.pedantic(lambda plot: plot.draw(), setup=lambda: ((build_plot(),), {}), rounds=rounds)
+        benchmark.extra_info["num_plays"] = num_plays
+        benchmark.extra_info["document_bytes"] = len(json.dumps(json_item(plot_grid)))
+        return plot_grid
+
+    return run
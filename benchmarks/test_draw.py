@@ -0,0 +1,55 @@
+from ptplot import PTPlot
+from ptplot.animation import Animation
+from ptplot.facet import Facet
+from ptplot.hover import Hover
+from ptplot.mapping import _clear_mapping_caches
+from ptplot.nfl import Aesthetics, Field
+from ptplot.plot import Positions, Tracks
+from ptplot.ptplot import _apply_mapping
+
+
+def test_static(benchmark_draw, tracking_data):
+    def build_plot():
+        return (
+            PTPlot(tracking_data)
+            + Field()
+            + Aesthetics("teamAbbr", "homeTeamFlag == 1", "ball")
+            + Tracks("x", "y", "nflId")
+            + Positions("x", "y", orientation="o", number="jerseyNumber", frame_filter="frame == 1")
+        )
+
+    benchmark_draw(build_plot)
+
+
+def test_animated(benchmark_draw, tracking_data):
+    def build_plot():
+        return (
+            PTPlot(tracking_data)
+            + Field()
+            + Aesthetics("teamAbbr", "homeTeamFlag == 1", "ball")
+            + Tracks("x", "y", "nflId")
+            + Positions("x", "y", orientation="o", number="jerseyNumber", name="positions")
+            + Hover("@displayName", "positions", ["displayName"])
+            + Animation("frame", 10)
+        )
+
+    benchmark_draw(build_plot)
+
+
+def test_faceted(benchmark_draw, tracking_data):
+    def build_plot():
+        return (
+            PTPlot(tracking_data)
+            + Field()
+            + Aesthetics("teamAbbr", "homeTeamFlag == 1", "ball")
+            + Tracks("x", "y", "nflId")
+            + Positions("x", "y", orientation="o", number="jerseyNumber", frame_filter="frame == 1")
+            + Facet("playId", num_col=4)
+        )
+
+    benchmark_draw(build_plot)
+
+
+def test_apply_mapping(benchmark, tracking_data, num_plays):
+    benchmark.pedantic(_apply_mapping, args=(tracking_data, "(x - 10) * 0.9144"), setup=_clear_mapping_caches, rounds=5)
+    benchmark.extra_info["num_plays"] = num_plays
@@ -1,16 +1,32 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Callable, Sequence
+import textwrap
+
+import numpy as np
+import pandas as pd
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
 from bokeh.models import CustomJS, Slider, Toggle
+from bokeh.util.serialization import make_id
 
+from ptplot.callback import (
+    FRAME_WORKER,
+    MERGED_CALLBACK_FOOTER,
+    MERGED_CALLBACK_HEADER,
+    PLAYBACK,
+    REQUEST_CURRENT_FRAME,
+)
 from ptplot.core import Layer
 
 
 if TYPE_CHECKING:
-    import pandas as pd
     from bokeh.models import Widget
 
 
+# How many frames past the one being shown to prepare while the browser is idle
+_PREFETCH_FRAMES = 10
+
+
 class Animation(Layer):
     """
     Animate a given visualization.
@@ -23,58 +39,242 @@ class Animation(Layer):
     ----------
     frame_mapping : The mapping used to determine the frame of the animation.
     frame_rate : The number of frames to display per second when using the play/pause
-        button.
+        button. Playback keeps to this rate in real time, skipping frames if the browser
+        can't draw them fast enough.
+    mode : How layers update what they show on every frame. With "data" (the default), the data
+        for the current frame is copied into each glyph's data source. With "view", each glyph
+        keeps all of its data and only the indices of the rows to show are updated, which is
+        faster in the browser for long animations. The trade-off is a larger visualization: each
+        glyph animated this way has its own copy of all its data, rather than sharing one copy
+        with the other layers drawing the same aesthetic group. Layers that don't support views
+        (e.g. Tracks, since Bokeh can't filter lines) always use "data", as do the players of
+        Aesthetics(vectorize=True), whose glyphs already filter their shared data by team. With
+        "worker", the data for each frame is worked out in a Web Worker rather than on the
+        browser's main thread, keeping the page responsive during large animations (currently only
+        Positions does this; other layers use "data").
+    speed : A multiplier for the playback rate, e.g. 0.5 to play at half speed or 2 to play at
+        double speed.
+    keep_every : If set, only keep every this many frames (counting from the first one), which shrinks
+        both the size of the visualization and the work done to animate it. The slider then moves
+        in steps of this many frames. Playback still runs in real time, at frame_rate. Layers that
+        only show one frame (e.g. Positions with a frame_filter) still show it if it isn't kept.
+    target_frame_rate : If set, keep only enough frames to show about this many per second during
+        playback, i.e. the same as setting keep_every to frame_rate / target_frame_rate.
+    time_mapping : The mapping with the time of each row, used by time_resolution. Can be numbers
+        (in seconds) or datetimes.
+    time_resolution : If set, keep only the first frame in each interval of this many seconds,
+        based on the earliest time in each frame. Useful when frames aren't evenly spaced in time.
+    event_mapping : If set while decimating, always keep the frames where this mapping is not null
+        (e.g. the frames marked with an event like the snap), even if they'd otherwise be skipped.
+        While the slider is between kept frames, each layer shows the latest kept frame.
+    interpolate : If True, treat the kept frames as keyframes, and show the frames in between them
+        (and during playback, in between those too) by interpolating the positions and orientations
+        of each entity, for layers that support it (e.g. Positions). Combined with decimation this
+        gives smooth animations from only a fraction of the data. Positions always uses "data"
+        mode when interpolating.
+    entity_mapping : The mapping that identifies each entity (e.g. player id) across frames. Required
+        if interpolate is True.
+    live_scrubbing : If True (the default), the visualization updates continuously while the slider
+        is being dragged, showing the latest frame each time the browser repaints. If False, it only
+        updates when the slider is released, which keeps dragging smooth for very large visualizations.
+    frame_cache_mb : How much memory (in megabytes) the browser can use to cache the data shown for
+        recently visited (and prefetched) frames, so going back to them doesn't mean working them out
+        again. Set to 0 to turn off caching.
     """
 
-    def __init__(self, frame_mapping: str, frame_rate: int):
+    def __init__(
+        self,
+        frame_mapping: str,
+        frame_rate: int,
+        mode: str = "data",
+        speed: float = 1,
+        keep_every: Optional[int] = None,
+        target_frame_rate: Optional[float] = None,
+        time_mapping: Optional[str] = None,
+        time_resolution: Optional[float] = None,
+        event_mapping: Optional[str] = None,
+        interpolate: bool = False,
+        entity_mapping: Optional[str] = None,
+        live_scrubbing: bool = True,
+        frame_cache_mb: float = 32,
+    ):
+        if mode not in ("data", "view", "worker"):
+            raise ValueError(f'mode must be "data", "view" or "worker", not "{mode}"')
+        if speed <= 0:
+            raise ValueError(f"speed must be positive, not {speed}")
+        if sum(policy is not None for policy in (keep_every, target_frame_rate, time_resolution)) > 1:
+            raise ValueError("Can only specify one of keep_every, target_frame_rate or time_resolution")
+        if keep_every is not None and keep_every < 1:
+            raise ValueError(f"keep_every must be at least 1, not {keep_every}")
+        if target_frame_rate is not None and target_frame_rate <= 0:
+            raise ValueError(f"target_frame_rate must be positive, not {target_frame_rate}")
+        if time_resolution is not None and (time_mapping is None or time_resolution <= 0):
+            raise ValueError("time_resolution must be positive, and requires a time_mapping")
+        if interpolate and entity_mapping is None:
+            raise ValueError("Interpolating between keyframes requires an entity_mapping")
+        if frame_cache_mb < 0:
+            raise ValueError(f"frame_cache_mb can't be negative, not {frame_cache_mb}")
         self.frame_mapping = frame_mapping
         self.frame_rate = frame_rate
+        self.mode = mode
+        self.speed = speed
+        self.keep_every = keep_every
+        self.target_frame_rate = target_frame_rate
+        self.time_mapping = time_mapping
+        self.time_resolution = time_resolution
+        self.event_mapping = event_mapping
+        self.interpolate = interpolate
+        self.entity_mapping = entity_mapping
+        self.live_scrubbing = live_scrubbing
+        self.frame_cache_mb = frame_cache_mb
+        self._frame_lookups: Dict[str, Optional[List[int]]] = {}
 
     def get_mappings(self) -> Sequence[str]:
-        return [self.frame_mapping]
+        mappings = [self.frame_mapping]
+        if self.time_mapping is not None:
+            mappings.append(self.time_mapping)
+        if self.event_mapping is not None:
+            mappings.append(self.event_mapping)
+        if self.entity_mapping is not None:
+            mappings.append(self.entity_mapping)
+        return mappings
+
+    @property
+    def frame_step(self) -> int:
+        """How many frames apart the frames kept by keep_every or target_frame_rate are."""
+        if self.keep_every is not None:
+            return self.keep_every
+        if self.target_frame_rate is not None:
+            return max(int(round(self.frame_rate / self.target_frame_rate)), 1)
+        return 1
+
+    def kept_frames(self, data: pd.DataFrame) -> Optional[np.ndarray[Any, Any]]:
+        """The sorted frames that are left after decimating, or None if every frame is kept."""
+        if self.frame_step == 1 and self.time_resolution is None:
+            return None
+        frames = pd.Series(data[self.frame_mapping].to_numpy(copy=False))
+        unique_frames = np.sort(frames.unique())
+        if len(unique_frames) == 0:
+            return unique_frames
+
+        if self.time_resolution is not None:
+            times = pd.Series(data[self.time_mapping].to_numpy(copy=False))
+            if not pd.api.types.is_numeric_dtype(times):
+                times = pd.to_datetime(times)
+            frame_times = times.groupby(frames.to_numpy()).min().reindex(unique_frames)
+            seconds = frame_times - frame_times.min()
+            if pd.api.types.is_timedelta64_dtype(seconds):
+                seconds = seconds.dt.total_seconds()
+            intervals = np.floor(seconds.to_numpy(dtype=float) / self.time_resolution)
+            is_kept = ~pd.Series(intervals).duplicated().to_numpy()
+        else:
+            is_kept = (unique_frames - unique_frames[0]) % self.frame_step == 0
+
+        if self.event_mapping is not None:
+            has_event = data[self.event_mapping].notna().to_numpy()
+            is_kept |= np.isin(unique_frames, frames[has_event].unique())
+        return unique_frames[is_kept]
+
+    def decimate(self, data: pd.DataFrame) -> Optional[np.ndarray[Any, Any]]:
+        """Which rows of the data are in kept frames, or None if every frame is kept."""
+        kept_frames = self.kept_frames(data)
+        if kept_frames is None:
+            return None
+        return np.isin(data[self.frame_mapping].to_numpy(copy=False), kept_frames)
 
     def animate(
         self, data: pd.DataFrame, layer_animations: Sequence[Callable[[str, Any], CustomJS]]
     ) -> Sequence[Widget]:
         min_frame = data[self.frame_mapping].min()
         max_frame = data[self.frame_mapping].max()
+        step = 1
+        frame_lookup = None
+        kept_frames = self.kept_frames(data)
+        if kept_frames is not None and len(kept_frames) > 0:
+            max_frame = kept_frames[-1]
+            step = self.frame_step
+            is_evenly_spaced = np.array_equal(kept_frames, np.arange(min_frame, max_frame + 1, step))
+            if step == 1 or not is_evenly_spaced or self.interpolate:
+                # The slider has to be able to land on every frame, and each one shows the latest kept
+                # frame (or is interpolated from it)
+                step = 1
+                frame_lookup = _frame_lookup(kept_frames, min_frame, max_frame)
         play_pause = Toggle(label="► Play", active=False)
-        slider = Slider(start=min_frame, end=max_frame, value=min_frame, step=1, title="Frame")
+        slider = Slider(start=min_frame, end=max_frame, value=min_frame, step=step, title="Frame")
+        # Layers added later get linked to the same slider, so they need the same lookup
+        self._frame_lookups[slider.id] = frame_lookup
         play_pause_js = CustomJS(
-            args={"slider": slider, "min_frame": min_frame, "max_frame": max_frame, "frame_rate": self.frame_rate},
-            code="""
-        var check_and_iterate = function(){
-            var slider_val = slider.value;
-            var toggle_val = cb_obj.active;
-            if(toggle_val == false) {
-                cb_obj.label = '► Play';
-                clearInterval(play_pause_loop);
-                }
-            else if(slider_val == max_frame) {
-                cb_obj.label = '► Play';
-                slider.value = min_frame;
-                cb_obj.active = false;
-                clearInterval(play_pause_loop);
-                }
-            else if(slider_val !== max_frame){
-                slider.value = slider_val + 1;
-                }
-            else {
-            clearInterval(play_pause_loop);
-                }
-        }
-        if(cb_obj.active == false){
-            cb_obj.label = '► Play';
-            clearInterval(play_pause_loop);
-        }
-        else {
-            cb_obj.label = '❚❚ Pause';
-            var play_pause_loop = setInterval(check_and_iterate, 1000 / frame_rate);
-        };
-                        """,
+            args={
+                "slider": slider,
+                "min_frame": min_frame,
+                "max_frame": max_frame,
+                "frame_rate": self.frame_rate,
+                "speed": self.speed,
+                "frame_lookup": frame_lookup,
+                "interpolate": self.interpolate,
+            },
+            code=PLAYBACK,
         )
         play_pause.js_on_change("active", play_pause_js)
-        for animation in layer_animations:
-            callback = animation(self.frame_mapping, min_frame)
-            slider.js_on_change("value", callback)
+        self.link(slider, layer_animations)
         return [play_pause, slider]
+
+    def link(self, slider: Slider, layer_animations: Sequence[Callable[[str, Any], CustomJS]]) -> None:
+        """Connect layer animations to the slider built by animate.
+
+        Rather than attaching every layer's callback to the slider separately, they're merged into a
+        single callback, so moving the slider runs one callback no matter how many glyphs are animated.
+        """
+        if len(layer_animations) == 0:
+            return
+        frame_lookup = self._frame_lookups.get(slider.id)
+        callbacks = [animation(self.frame_mapping, slider.start) for animation in layer_animations]
+        slider.js_on_change(
+            "value" if self.live_scrubbing else "value_throttled",
+            _merge_callbacks(callbacks, slider.start, frame_lookup, int(self.frame_cache_mb * 2**20)),
+        )
+
+
+def _frame_lookup(kept_frames: np.ndarray[Any, Any], min_frame: Any, max_frame: Any) -> List[int]:
+    """For every step of the slider, how many steps past the start the latest kept frame is."""
+    steps = min_frame + np.arange(int(max_frame - min_frame) + 1)
+    latest_kept = kept_frames[np.searchsorted(kept_frames, steps, side="right") - 1]
+    return (latest_kept - min_frame).astype(int).tolist()
+
+
+def _merge_callbacks(
+    callbacks: Sequence[CustomJS],
+    initial_frame: Any,
+    frame_lookup: Optional[List[int]] = None,
+    cache_bytes: int = 0,
+) -> CustomJS:
+    """Combine animation callbacks into one that runs all of them.
+
+    Callbacks with the same code and argument names (e.g. the tracks of every player) become a single
+    JS function, which is called once for each callback's arguments. If set, frame_lookup maps each
+    step of the slider to the frame that's shown for it. cache_bytes is the budget for caching the
+    data shown for each frame.
+    """
+    groups: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+    for callback in callbacks:
+        groups.setdefault((callback.code, tuple(sorted(callback.args))), []).append(dict(callback.args))
+
+    code = [MERGED_CALLBACK_HEADER]
+    args: Dict[str, Any] = {
+        "initial_frame": initial_frame,
+        "frame_lookup": frame_lookup,
+        "prefetch_frames": _PREFETCH_FRAMES,
+        "cache_bytes": cache_bytes,
+        # Only embed the worker's code if something uses it
+        "worker_code": FRAME_WORKER if any(callback.code == REQUEST_CURRENT_FRAME for callback in callbacks) else None,
+        "callback_id": make_id(),
+    }
+    body = []
+    for group_index, ((group_code, arg_names), group_args) in enumerate(groups.items()):
+        body.append(f"function update_{group_index}({{{', '.join(arg_names)}}}) {{{group_code}}}")
+        body.append(f"animations_{group_index}.forEach(update_{group_index});")
+        args[f"animations_{group_index}"] = group_args
+    # Everything in between the header and footer is the body of show_frame
+    code.append(textwrap.indent("\n".join(body), "    "))
+    code.append(MERGED_CALLBACK_FOOTER)
+    return CustomJS(args=args, code="\n".join(code))
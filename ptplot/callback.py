@@ -1,39 +1,506 @@
+# By default, animations work by replacing the data in each source with the rows for the current frame.
 # This can also be done via setting an IndexFilter view on the data and then updating the indices
-# of that filter. This is actually how it works in 0.2.0. However there is a bug when trying
-# to animate a single object (https://github.com/bokeh/bokeh/issues/11439) so for
-# the time being this is the best way to do it :/
+# of that filter, which avoids reallocating any columns (and is how it worked in 0.2.0). However
+# there is a bug when trying to animate a single object (https://github.com/bokeh/bokeh/issues/11439),
+# so that's only used with Animation(mode="view"), which works around the bug by always including an
+# invisible sentinel row in the view.
+#
+# Rather than each layer keeping its own copy of all the data to animate, every animated layer drawing
+# the same (facet, aesthetic group) shares a single frame store, passed to the callbacks as full_source.
+#
+# The callbacks rely on the rows of each source being sorted by frame, with frame_offsets (built by
+# ptplot.plot._frame_offsets) giving the rows where each frame starts and ends, so finding and copying
+# the rows to show is O(1) per column rather than a scan through the whole play.
+#
+# They aren't attached to the slider directly. Instead, Animation merges every layer's callbacks
+# into a single one (see MERGED_CALLBACK_HEADER), which defines frame_value (the slider value to
+# show), frame_index (how many steps frame_value is past the start of the slider, or for decimated
+# animations how far past it the latest kept frame is), prefetching (whether the frame is only being
+# prepared, not shown) and changed (a Set that each callback adds the models it modified to, so they
+# can all be redrawn together).
 FIND_CURRENT_FRAME = """
-var data = source.data;
-var full_data = full_source.data;
-for (const column in data) {
-    data[column] = [];
-    for (let i = 0; i < full_data[frame_column].length; i++) {
-        if (full_data[frame_column][i] == cb_obj.value) {
-            data[column].push(full_data[column][i]);
-        }
-        // Assumes data is sorted by frame_column
-        if (full_data[frame_column][i] > cb_obj.value) {
-            break;
+if (prefetching && cache_bytes <= 0) {
+    return;  // Without a cache there's nothing to prefetch
+}
+let columns = cached_slice(source, frame_index);
+if (columns === undefined) {
+    const starts = frame_offsets.data.start;
+    const ends = frame_offsets.data.end;
+    const start = (frame_index >= 0 && frame_index < starts.length) ? starts[frame_index] : 0;
+    const end = (frame_index >= 0 && frame_index < ends.length) ? ends[frame_index] : 0;
+    const full_data = full_source.data;
+    columns = {};
+    for (const column in source.data) {
+        const full_column = full_data[column];
+        // Typed arrays can be viewed without copying, but plain arrays (e.g. of strings) have to be copied
+        columns[column] = (
+            full_column.subarray !== undefined ? full_column.subarray(start, end) : full_column.slice(start, end)
+        );
+    }
+    cache_slice(source, frame_index, columns);
+}
+if (!prefetching) {
+    Object.assign(source.data, columns);
+    changed.add(source);
+}
+"""
+
+# Animations with keyframes only embed some of the frames, and show the ones in between by moving
+# every entity (player or ball) along a straight line from where it is in the latest keyframe to where
+# it is in the next one, turning whichever way round is shorter. next_rows gives the row of each
+# entity in the next keyframe, or -1 if it's not in it (in which case it stays where it is).
+INTERPOLATE_CURRENT_FRAME = """
+if (prefetching && cache_bytes <= 0) {
+    return;  // Without a cache there's nothing to prefetch
+}
+let columns = cached_slice(source, frame_value);
+if (columns === undefined) {
+    const starts = frame_offsets.data.start;
+    const ends = frame_offsets.data.end;
+    const start = (frame_index >= 0 && frame_index < starts.length) ? starts[frame_index] : 0;
+    const end = (frame_index >= 0 && frame_index < ends.length) ? ends[frame_index] : 0;
+    const full_data = full_source.data;
+    columns = {};
+    for (const column in source.data) {
+        const full_column = full_data[column];
+        columns[column] = (
+            full_column.subarray !== undefined ? full_column.subarray(start, end) : full_column.slice(start, end)
+        );
+    }
+    const next = next_rows.data.next;
+    const frames = full_data[frame_column];
+    const weights = new Float64Array(end - start);
+    for (let i = start; i < end; i++) {
+        const j = next[i];
+        const weight = j < 0 ? 0 : (frame_value - frames[i]) / (frames[j] - frames[i]);
+        weights[i - start] = Math.min(Math.max(weight, 0), 1);
+    }
+    for (const column of interpolated.concat(angles)) {
+        const full_column = full_data[column];
+        const is_angle = angles.includes(column);
+        const values = new Float64Array(end - start);
+        for (let i = start; i < end; i++) {
+            const from = full_column[i];
+            const weight = weights[i - start];
+            if (weight == 0) {
+                values[i - start] = from;
+            } else if (is_angle) {
+                const difference = (((full_column[next[i]] - from) % 360) + 540) % 360 - 180;
+                values[i - start] = (((from + weight * difference) % 360) + 360) % 360;
+            } else {
+                values[i - start] = from + weight * (full_column[next[i]] - from);
+            }
+        }
+        columns[column] = values;
+    }
+    cache_slice(source, frame_value, columns);
+}
+if (!prefetching) {
+    Object.assign(source.data, columns);
+    changed.add(source);
+}
+"""
+
+# With Animation(mode="worker"), the rows (and interpolated positions) of each frame are worked out
+# in a Web Worker instead, which gets its own copy of the typed columns of the frame store when it
+# first needs them, and sends back new arrays for every frame by transferring them, so they aren't
+# copied again. Only plain arrays (e.g. of strings), which can't be transferred, are sliced on the main
+# thread. Each source only has one frame being worked out at a time: if the slider moves on in the
+# meantime, the latest frame it's moved to is requested once the current one is done, and replies for
+# frames that are no longer the latest one shown (e.g. after scrubbing back to a cached frame) are
+# cached without being shown.
+REQUEST_CURRENT_FRAME = """
+if (prefetching) {
+    return;  // The worker only works out frames as they're requested
+}
+const worker = frame_worker();
+let entry = worker.sources.get(source.id);
+if (entry === undefined) {
+    entry = {
+        source: source,
+        full_source: full_source,
+        frame_offsets: frame_offsets,
+        in_flight: false,
+        wanted: null,
+        latest: null,
+    };
+    worker.sources.set(source.id, entry);
+    const columns = {};
+    for (const column in source.data) {
+        const full_column = full_source.data[column];
+        if (full_column.subarray !== undefined) {
+            columns[column] = full_column;
         }
     }
+    worker.post({
+        type: "add",
+        id: source.id,
+        columns: columns,
+        starts: frame_offsets.data.start,
+        ends: frame_offsets.data.end,
+        next: next_rows !== null ? next_rows.data.next : null,
+        frames: full_source.data[frame_column],
+        interpolated: interpolated,
+        angles: angles,
+    });
 }
-source.change.emit();
+// Replies for any other frame than this one are stale by the time they arrive, so they're only cached
+entry.latest = frame_value;
+const cached = cached_slice(source, frame_value);
+if (cached !== undefined) {
+    entry.wanted = null;
+    Object.assign(source.data, cached);
+    changed.add(source);
+    return;
+}
+worker.request(entry, {frame_index: frame_index, frame_value: frame_value});
 """
 
+# The code run by the worker. handle takes each message, and replies with the columns for frames.
+FRAME_WORKER = """
+const sources = new Map();
+const handle = function(message, reply) {
+    if (message.type === "add") {
+        sources.set(message.id, message);
+        return;
+    }
+    const source = sources.get(message.id);
+    const frame_index = message.frame_index;
+    const start = (frame_index >= 0 && frame_index < source.starts.length) ? source.starts[frame_index] : 0;
+    const end = (frame_index >= 0 && frame_index < source.ends.length) ? source.ends[frame_index] : 0;
+    const columns = {};
+    for (const column in source.columns) {
+        columns[column] = source.columns[column].slice(start, end);
+    }
+    if (source.next !== null) {
+        const next = source.next;
+        const frames = source.frames;
+        for (const column of source.interpolated.concat(source.angles)) {
+            const full_column = source.columns[column];
+            const is_angle = source.angles.includes(column);
+            const values = columns[column];
+            for (let i = start; i < end; i++) {
+                const j = next[i];
+                const weight = j < 0 ? 0 : (message.frame_value - frames[i]) / (frames[j] - frames[i]);
+                const from = full_column[i];
+                if (weight <= 0) {
+                    continue;
+                } else if (is_angle) {
+                    const difference = (((full_column[j] - from) % 360) + 540) % 360 - 180;
+                    values[i - start] = (((from + Math.min(weight, 1) * difference) % 360) + 360) % 360;
+                } else {
+                    values[i - start] = from + Math.min(weight, 1) * (full_column[j] - from);
+                }
+            }
+        }
+    }
+    const frame = {id: message.id, frame_index: frame_index, frame_value: message.frame_value, columns: columns};
+    reply(frame, Object.values(columns).map((values) => values.buffer));
+};
+"""
+
+# Tracks draw every track in an aesthetic group with a single multi_line, where each row of line_columns
+# is one track's points. The rows of the group's frame store in each track are given (in frame order)
+# by track_rows, with track t's rows running from track_starts[t] to track_starts[t + 1], and
+# frame_offsets giving how many of them are up to each frame. The points copied out of the store so far
+# are kept on the source, so each move of the slider only copies the points added since the furthest
+# frame shown yet, and then every track is shown as a view of its copied points up to the new frame,
+# rather than rebuilding the whole track.
 FIND_ALL_FRAMES_UP_TO_CURRENT_FRAME = """
-var data = source.data;
-var full_data = full_source.data;
-for (const column in data) {
-    data[column] = [];
-    for (let i = 0; i < full_data[frame_column].length; i++) {
-        if (full_data[frame_column][i] <= cb_obj.value) {
-            data[column].push(full_data[column][i]);
-        }
-        // Assumes data is sorted by frame_column
-        if (full_data[frame_column][i] > cb_obj.value) {
+const ends = frame_offsets.data.end;
+const rows = track_rows.data.rows;
+const num_tracks = track_starts.length - 1;
+const num_steps = num_tracks > 0 ? ends.length / num_tracks : 0;
+const step = Math.min(frame_index, num_steps - 1);
+if (source._ptplot_copied === undefined) {
+    source._ptplot_copied = {};
+}
+for (const column of line_columns) {
+    const full_column = full_source.data[column];
+    let copied = source._ptplot_copied[column];
+    if (copied === undefined) {
+        copied = {values: new Float64Array(rows.length), filled: new Int32Array(num_tracks)};
+        source._ptplot_copied[column] = copied;
+    }
+    const tracks = new Array(num_tracks);
+    for (let track = 0; track < num_tracks; track++) {
+        const track_start = track_starts[track];
+        const end = step < 0 ? 0 : ends[step * num_tracks + track];
+        for (let i = copied.filled[track]; i < end; i++) {
+            copied.values[track_start + i] = full_column[rows[track_start + i]];
+        }
+        copied.filled[track] = Math.max(copied.filled[track], end);
+        tracks[track] = copied.values.subarray(track_start, track_start + end);
+    }
+    if (!prefetching) {
+        source.data[column] = tracks;
+    }
+}
+if (!prefetching) {
+    changed.add(source);
+}
+"""
+
+FILTER_CURRENT_FRAME = """
+if (prefetching && cache_bytes <= 0) {
+    return;  // Without a cache there's nothing to prefetch
+}
+let columns = cached_slice(view, frame_index);
+if (columns === undefined) {
+    const starts = frame_offsets.data.start;
+    const ends = frame_offsets.data.end;
+    const start = (frame_index >= 0 && frame_index < starts.length) ? starts[frame_index] : 0;
+    const end = (frame_index >= 0 && frame_index < ends.length) ? ends[frame_index] : 0;
+    const indices = new Array(end - start + 1);
+    for (let i = start; i < end; i++) {
+        indices[i - start] = i;
+    }
+    indices[end - start] = sentinel;
+    columns = {indices: indices};
+    cache_slice(view, frame_index, columns);
+}
+if (!prefetching) {
+    index_filter.indices = columns.indices;
+    changed.add(view);
+}
+"""
+
+# Revisiting a frame (e.g. scrubbing back and forth around the snap) reuses the columns worked out for
+# it last time, which are kept in a least-recently-used cache shared by every source animated by the
+# slider, holding at most cache_bytes of new arrays. Views of the frame store are only counted
+# as a few bytes, since they don't copy anything.
+MERGED_CALLBACK_HEADER = """
+if (cb_obj._ptplot_frame_cache === undefined) {
+    // A Map iterates in insertion order, so moving entries to the end when used keeps the least recently
+    // used one first
+    cb_obj._ptplot_frame_cache = {entries: new Map(), bytes: 0};
+}
+const frame_cache = cb_obj._ptplot_frame_cache;
+const cached_slice = function(model, key) {
+    const cache_key = model.id + ":" + key;
+    const entry = frame_cache.entries.get(cache_key);
+    if (entry !== undefined) {
+        frame_cache.entries.delete(cache_key);
+        frame_cache.entries.set(cache_key, entry);
+        return entry.columns;
+    }
+    return undefined;
+};
+const cache_slice = function(model, key, columns) {
+    let bytes = 0;
+    for (const column in columns) {
+        const values = columns[column];
+        const is_view = values.buffer !== undefined && values.byteLength < values.buffer.byteLength;
+        bytes += values.buffer === undefined ? 8 * values.length : (is_view ? 64 : values.byteLength);
+    }
+    if (bytes > cache_bytes) {
+        return;
+    }
+    frame_cache.entries.set(model.id + ":" + key, {columns: columns, bytes: bytes});
+    frame_cache.bytes += bytes;
+    for (const [oldest_key, oldest] of frame_cache.entries) {
+        if (frame_cache.bytes <= cache_bytes) {
             break;
         }
+        frame_cache.entries.delete(oldest_key);
+        frame_cache.bytes -= oldest.bytes;
+    }
+};
+// The worker used by mode="worker", created the first time it's needed and shared by every source
+const frame_worker = function() {
+    if (cb_obj._ptplot_worker === undefined) {
+        const sources = new Map();
+        const receive = function(reply) {
+            const entry = sources.get(reply.id);
+            entry.in_flight = false;
+            const starts = entry.frame_offsets.data.start;
+            const ends = entry.frame_offsets.data.end;
+            const start = (reply.frame_index >= 0 && reply.frame_index < starts.length) ? starts[reply.frame_index] : 0;
+            const end = (reply.frame_index >= 0 && reply.frame_index < ends.length) ? ends[reply.frame_index] : 0;
+            const columns = reply.columns;
+            for (const column in entry.source.data) {
+                if (!(column in columns)) {
+                    columns[column] = entry.full_source.data[column].slice(start, end);
+                }
+            }
+            cache_slice(entry.source, reply.frame_value, columns);
+            if (reply.frame_value === entry.latest) {
+                Object.assign(entry.source.data, columns);
+                entry.source.change.emit();
+            }
+            if (entry.wanted !== null) {
+                const wanted = entry.wanted;
+                entry.wanted = null;
+                request(entry, wanted);
+            }
+        };
+        let post;
+        try {
+            const code = worker_code + "\\nonmessage = (event) => handle(event.data, postMessage);";
+            const worker = new Worker(URL.createObjectURL(new Blob([code], {type: "text/javascript"})));
+            worker.onmessage = (event) => receive(event.data);
+            post = (message) => worker.postMessage(message);
+        } catch (error) {
+            // Workers aren't available (e.g. they're blocked by a content security policy), so do the
+            // work on the main thread instead
+            const handle = new Function(worker_code + "\\nreturn handle;")();
+            post = (message) => handle(message, receive);
+        }
+        const request = function(entry, frame) {
+            if (entry.in_flight) {
+                entry.wanted = frame;
+                return;
+            }
+            entry.in_flight = true;
+            post({type: "frame", id: entry.source.id, frame_index: frame.frame_index, frame_value: frame.frame_value});
+        };
+        cb_obj._ptplot_worker = {sources: sources, post: post, request: request};
+    }
+    return cb_obj._ptplot_worker;
+};
+// Shows a frame by running every layer's callback. When prefetching, the callbacks only do whatever
+// work they can ahead of time (e.g. copying the points of tracks), without changing what's shown.
+const show_frame = function(frame_value, changed, prefetching) {
+    // The slider value is only fractional when playing an animation with keyframes, where it's between
+    // frames
+    let frame_index = Math.floor(frame_value - initial_frame + 1e-6);
+    if (frame_lookup !== null && frame_index >= 0 && frame_index < frame_lookup.length) {
+        // Some frames were decimated away, so show the latest one that was kept
+        frame_index = frame_lookup[frame_index];
+    }
+"""
+
+# Moving the slider (by dragging it, or during playback) only records that a frame needs showing. The
+# frame is shown just before the browser next repaints, for whatever the slider's value is by then, so
+# however fast the slider moves at most one frame is worked out per repaint rather than falling behind
+# on frames that are already stale. Notifying models that they've changed is what makes Bokeh redraw
+# them, so that's done at the same time, once per model. Afterwards, while the browser is idle, the
+# next few frames are prefetched.
+MERGED_CALLBACK_FOOTER = """
+};
+if (cb_obj._ptplot_pending === undefined) {
+    cb_obj._ptplot_pending = new Map();
+}
+// Other merged callbacks attached to the same slider (for layers added later) get shown together
+cb_obj._ptplot_pending.set(callback_id, show_frame);
+if (!cb_obj._ptplot_scheduled) {
+    cb_obj._ptplot_scheduled = true;
+    const prefetch = function(deadline) {
+        const frame_value = cb_obj.value;
+        for (let step = 1; step <= prefetch_frames && deadline.timeRemaining() > 1; step++) {
+            if (cb_obj.value != frame_value || frame_value + step * cb_obj.step > cb_obj.end) {
+                break;
+            }
+            for (const show of cb_obj._ptplot_shown) {
+                show(frame_value + step * cb_obj.step, null, true);
+            }
+        }
+    };
+    const show_latest_frame = function() {
+        cb_obj._ptplot_scheduled = false;
+        const pending = Array.from(cb_obj._ptplot_pending.values());
+        cb_obj._ptplot_pending.clear();
+        const changed = new Set();
+        for (const show of pending) {
+            show(cb_obj.value, changed, false);
+        }
+        for (const model of changed) {
+            if (model.compute_indices !== undefined) {
+                // Views only listen for their list of filters being replaced, not for changes to the
+                // filters themselves
+                model.compute_indices();
+            } else {
+                model.change.emit();
+            }
+        }
+        cb_obj._ptplot_shown = pending;
+        if (prefetch_frames > 0 && typeof requestIdleCallback !== "undefined") {
+            requestIdleCallback(prefetch);
+        }
+    };
+    if (typeof requestAnimationFrame !== "undefined") {
+        requestAnimationFrame(show_latest_frame);
+    } else {
+        show_latest_frame();
+    }
+}
+"""
+
+# Playback is driven by requestAnimationFrame rather than setInterval: every tick works out which
+# frame should be showing from how long it's been playing, so if the browser can't keep up (or the
+# tab was in the background) frames are skipped to stay in time instead of the animation slowing
+# down. The state is stored on the toggle, and only one tick is ever scheduled at a time, so
+# clicking play repeatedly can't start overlapping loops.
+PLAYBACK = """
+if (cb_obj._ptplot_playback === undefined) {
+    cb_obj._ptplot_playback = {handle: null, start_time: null, start_frame: null, last_frame: null};
+}
+const state = cb_obj._ptplot_playback;
+const request_tick = typeof requestAnimationFrame !== "undefined" ? requestAnimationFrame : (
+    (tick) => setTimeout(() => tick(Date.now()), 1000 / 60)
+);
+const cancel_tick = typeof cancelAnimationFrame !== "undefined" ? cancelAnimationFrame : clearTimeout;
+const tick = function(now) {
+    state.handle = null;
+    if (!cb_obj.active) {
+        return;
+    }
+    if (state.start_time === null || slider.value !== state.last_frame) {
+        // Just started, or the slider was moved by hand while playing: continue from wherever it is now
+        state.start_time = now;
+        state.start_frame = slider.value;
     }
+    const elapsed_frames = (now - state.start_time) / 1000 * frame_rate * speed;
+    // With keyframes, the frames in between are interpolated, so playback can be as smooth as the display
+    let frame = state.start_frame + (
+        interpolate ? elapsed_frames : Math.floor(elapsed_frames / slider.step) * slider.step
+    );
+    if (frame > max_frame) {
+        if (slider.value >= max_frame) {
+            // The last frame has been shown for long enough, so go back to the beginning and stop
+            slider.value = slider.value_throttled = min_frame;
+            cb_obj.active = false;
+            return;
+        }
+        // Frames were skipped past the end: show the last one for a full frame before stopping
+        frame = max_frame;
+        state.start_time = now;
+        state.start_frame = max_frame;
+    } else if (frame_lookup !== null && !interpolate) {
+        // Only move the slider when a different kept frame is due
+        frame = min_frame + frame_lookup[Math.round(frame - min_frame)];
+    }
+    if (frame !== slider.value) {
+        slider.value = frame;
+        // Playing isn't dragging, so it also counts as the slider being released on the new frame
+        slider.value_throttled = frame;
+    }
+    state.last_frame = slider.value;
+    state.handle = request_tick(tick);
+};
+if (cb_obj.active) {
+    cb_obj.label = '❚❚ Pause';
+    state.start_time = null;
+    if (state.handle === null) {
+        state.handle = request_tick(tick);
+    }
+} else {
+    cb_obj.label = '► Play';
+    if (state.handle !== null) {
+        cancel_tick(state.handle);
+        state.handle = null;
+    }
+}
+"""
+
+# The code of the CustomJSFilter that picks out one team and home/away group of the players when they're
+# all in one source (see nfl.Aesthetics(vectorize=True)), so each group keeps its own glyph and legend entry.
+SELECT_GROUP = """
+const teams = source.data[team_column];
+const homes = home_column === null ? null : source.data[home_column];
+const selected = new Array(teams.length);
+for (let i = 0; i < teams.length; i++) {
+    selected[i] = teams[i] === team && (homes === null || Boolean(homes[i]) === is_home);
 }
-source.change.emit();
+return selected;
 """
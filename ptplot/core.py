@@ -3,13 +3,18 @@ from __future__ import annotations
 from abc import ABC
 from dataclasses import dataclass
 
+import numpy as np
 import pandas as pd
+from bokeh.models import CustomJSFilter
 from bokeh.plotting import figure
 
-from typing import TYPE_CHECKING, Any, Callable, Iterator, Mapping, Sequence, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Mapping, Sequence, Optional, Tuple
+
+from ptplot.callback import SELECT_GROUP
+from ptplot.grouping import _group_by, _group_codes
 
 if TYPE_CHECKING:
-    from bokeh.models import CustomJS, GlyphRenderer
+    from bokeh.models import ColumnDataSource, CustomJS, Filter, GlyphRenderer
     from ptplot import PTPlot
 
 
@@ -19,12 +24,24 @@ class _Metadata:
     is_home: bool = True
     color_list: Sequence[str] = ("black", "gray")
     marker: Optional[Callable[[figure], Callable[..., GlyphRenderer]]] = None
+    # All the rows of the group, sorted by frame, shared by every animated layer (see ptplot.plot._frame_store)
+    frame_store: Optional[ColumnDataSource] = None
+    # For a group with all the players in it (see _Aesthetics), the metadata of each team and home/away
+    # group within it. Layers draw one glyph for each of them, all sharing the same source.
+    subgroups: Sequence[_Metadata] = ()
+    # Picks out a subgroup's rows from the source its glyph shares with the other subgroups
+    view_filter: Optional[Filter] = None
 
 
 class Layer(ABC):
     def get_mappings(self) -> Sequence[str]:
         return []
 
+    def get_frame_filter(self) -> Optional[str]:
+        # The True/False mapping picking out the frame(s) the layer shows, if it only shows some of them.
+        # Those frames are drawn even if the animation decimates them away.
+        return None
+
     def draw(
         self, ptplot: PTPlot, data: pd.DataFrame, bokeh_figure: figure, metadata: _Metadata
     ) -> Optional[Sequence[Callable[[str, Any], CustomJS]]]:
@@ -41,10 +58,12 @@ class _Aesthetics(Layer):
         team_ball_mapping: Optional[str] = None,
         home_away_mapping: Optional[str] = None,
         ball_identifier: Optional[str] = None,
+        vectorize: bool = False,
     ):
         self.team_ball_mapping = team_ball_mapping
         self.home_away_mapping = home_away_mapping
         self.ball_identifier = ball_identifier
+        self.vectorize = vectorize
 
     def get_mappings(self) -> Sequence[str]:
         mappings = []
@@ -54,24 +73,96 @@ class _Aesthetics(Layer):
             mappings.append(self.home_away_mapping)
         return mappings
 
+    def group_codes(self, data: pd.DataFrame, positions: np.ndarray[Any, Any]) -> List[np.ndarray[Any, Any]]:
+        """The group codes of each level of the grouping done by map_aesthetics, for the rows at the given positions.
+
+        Ordering the data by these codes makes every group yielded by map_aesthetics a contiguous block.
+        """
+        codes = []
+        if self.vectorize and self.team_ball_mapping is not None:
+            # All the players are in one group, in their original (e.g. frame) order, followed by the ball
+            if self.ball_identifier is not None:
+                codes.append(self._is_ball(data)[positions].astype(np.int8))
+            return codes
+        if self.team_ball_mapping is not None:
+            codes.append(_group_codes(data, self.team_ball_mapping, positions))
+        if self.home_away_mapping is not None:
+            home_away_codes = _group_codes(data, self.home_away_mapping, positions)
+            if self.team_ball_mapping is not None and self.ball_identifier is not None:
+                # The ball isn't split into home and away, so its rows need to keep their order
+                home_away_codes = np.where(self._is_ball(data)[positions], -1, home_away_codes)
+            codes.append(home_away_codes)
+        return codes
+
+    def _is_ball(self, data: pd.DataFrame) -> np.ndarray[Any, Any]:
+        if self.ball_identifier is None:
+            return np.zeros(len(data), dtype=bool)
+        return np.asarray(data[self.team_ball_mapping].to_numpy(copy=False) == self.ball_identifier)
+
+    def _ball_metadata(self, label: str) -> _Metadata:
+        return _Metadata(
+            label=label,
+            is_home=True,
+            # have to access the __func__ method directly to avoid needing to wrap all the
+            # methods in staticmethod decorators
+            # Also need to ignore mypy because it doesn't like doing that.
+            color_list=self.ball_colors,
+            marker=self.ball_marker_generator.__func__,  # type: ignore
+        )
+
+    def _player_subgroups(self, players: pd.DataFrame) -> List[_Metadata]:
+        """The metadata of each team and home/away group of the players, in the order map_aesthetics would
+        otherwise yield them, with a filter that picks out each group's rows."""
+        group_keys = pd.DataFrame({"team": players[self.team_ball_mapping].to_numpy(copy=False)})
+        if self.home_away_mapping is not None:
+            group_keys["is_home"] = players[self.home_away_mapping].to_numpy(copy=False).astype(bool)
+        group_keys = group_keys.dropna().drop_duplicates().sort_values(list(group_keys.columns))
+        subgroups = []
+        for group in group_keys.itertuples(index=False):
+            is_home = bool(group.is_home) if self.home_away_mapping is not None else True
+            view_filter = CustomJSFilter(
+                args={
+                    "team_column": self.team_ball_mapping,
+                    "team": group.team,
+                    "home_column": self.home_away_mapping,
+                    "is_home": is_home,
+                },
+                code=SELECT_GROUP,
+            )
+            subgroups.append(
+                _Metadata(
+                    label=group.team,
+                    is_home=is_home,
+                    color_list=self.team_color_mapping[group.team],
+                    view_filter=view_filter,
+                )
+            )
+        return subgroups
+
     def map_aesthetics(self, data: pd.DataFrame) -> Iterator[Tuple[pd.DataFrame, _Metadata]]:
+        if self.vectorize and self.team_ball_mapping is not None:
+            is_ball = self._is_ball(data)
+            num_players = len(data) - np.count_nonzero(is_ball)
+            if not is_ball[:num_players].any():
+                # Ordered by group_codes, so the players can be sliced out without copying
+                players, ball = data.iloc[:num_players], data.iloc[num_players:]
+            else:
+                players, ball = data[~is_ball], data[is_ball]
+            subgroups = self._player_subgroups(players)
+            if len(subgroups) > 0:
+                yield players, _Metadata(label=None, subgroups=subgroups)
+            if len(ball) > 0:
+                yield ball, self._ball_metadata(self.ball_identifier)  # type: ignore
+            return
         if self.team_ball_mapping is not None:
-            team_ball_groups = data.groupby(self.team_ball_mapping)
+            team_ball_groups = _group_by(data, self.team_ball_mapping)
             for team_ball_name, team_ball_data in team_ball_groups:
                 if self.ball_identifier is not None and team_ball_name == self.ball_identifier:
-                    yield team_ball_data, _Metadata(
-                        label=team_ball_name,
-                        is_home=True,
-                        # have to access the __func__ method directly to avoid needing to wrap all the
-                        # methods in staticmethod decorators
-                        # Also need to ignore mypy because it doesn't like doing that.
-                        color_list=self.ball_colors,
-                        marker=self.ball_marker_generator.__func__,  # type: ignore
-                    )
+                    yield team_ball_data, self._ball_metadata(team_ball_name)
                 else:
                     team_color_list = self.team_color_mapping[team_ball_name]
                     if self.home_away_mapping is not None:
-                        home_away_groups = team_ball_data.groupby(self.home_away_mapping)
+                        home_away_groups = _group_by(team_ball_data, self.home_away_mapping)
                         for is_home, home_away_data in home_away_groups:
                             yield home_away_data, _Metadata(
                                 label=team_ball_name, is_home=is_home, color_list=team_color_list
@@ -80,7 +171,7 @@ class _Aesthetics(Layer):
                         yield team_ball_data, _Metadata(label=team_ball_name, is_home=True, color_list=team_color_list)
         else:
             if self.home_away_mapping is not None:
-                home_away_groups = data.groupby(self.home_away_mapping)
+                home_away_groups = _group_by(data, self.home_away_mapping)
                 for is_home, home_away_data in home_away_groups:
                     yield home_away_data, _Metadata(is_home=is_home)
             else:
@@ -3,6 +3,7 @@ from __future__ import annotations
 import math
 
 from .core import Layer
+from .grouping import _group_by
 
 from typing import TYPE_CHECKING, Any, Iterator, Optional, Sequence, Tuple
 
@@ -37,7 +38,7 @@ class Facet(Layer):
         return [self.facet_mapping]
 
     def faceting(self, data: pd.DataFrame) -> Iterator[Tuple[Any, pd.DataFrame]]:
-        groups = data.groupby(self.facet_mapping, sort=False)
+        groups = list(_group_by(data, self.facet_mapping, sort=False))
         if self.num_col is not None:
             self.num_row = math.ceil(len(groups) / self.num_col)
         elif self.num_row is not None:
@@ -45,7 +46,7 @@ class Facet(Layer):
         else:
             self.num_row = len(groups)
             self.num_col = 1
-        return groups
+        return iter(groups)
 
     def draw(self, ptplot: PTPlot, data: pd.DataFrame, bokeh_figure: figure, metadata: _Metadata) -> None:
         # This will get run multiple times per aesthetic, but the title ought to be the same
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Iterator, Optional, Sequence, Tuple
+
+
+def _frame_order(data: pd.DataFrame, frame_mapping: str) -> Optional[np.ndarray[Any, Any]]:
+    """The positions that put the data in frame order, or None if it's already in order."""
+    frames = pd.Series(data[frame_mapping].to_numpy(copy=False))
+    if frames.is_monotonic_increasing:
+        return None
+    # A stable sort keeps the rows for each frame in their original order (e.g. by player)
+    return frames.sort_values(kind="stable").index.to_numpy()
+
+
+def _group_codes(
+    data: pd.DataFrame, mapping: str, positions: np.ndarray[Any, Any], sort: bool = True
+) -> np.ndarray[Any, Any]:
+    """Factorize a mapping into integer group codes, for the rows at the given positions (in that order).
+
+    The codes follow the same group order as data.groupby(mapping, sort=sort) would on those rows,
+    with null keys coded as -1.
+    """
+    codes, _ = pd.factorize(pd.Series(data[mapping].to_numpy(copy=False)[positions]), sort=sort)
+    return codes
+
+
+def _order_by_groups(
+    group_codes: Sequence[np.ndarray[Any, Any]], positions: np.ndarray[Any, Any]
+) -> Optional[np.ndarray[Any, Any]]:
+    """Compute the positions that make every level of a nested grouping contiguous.
+
+    All levels are combined with a single stable lexsort, so rows are ordered by the first level's
+    codes, then the second's within that, and so on, and rows that share all their codes stay in the
+    order given by the input positions (e.g. frame order). Afterwards each group, at every level of
+    nesting, is a contiguous block of rows that _group_by can slice out without copying.
+
+    Parameters
+    ----------
+    group_codes : The codes of each level of the grouping (outermost first), as computed by
+        _group_codes for the rows at the input positions.
+    positions : The positions of the rows in the order they should have within each group.
+
+    Returns
+    -------
+    The positions to take from the data, or None if it is already in the right order.
+    """
+    if len(group_codes) > 0:
+        # np.lexsort uses the last key as the primary one
+        positions = positions[np.lexsort(group_codes[::-1])]
+    if np.array_equal(positions, np.arange(len(positions))):
+        return None
+    return positions
+
+
+def _group_by(data: pd.DataFrame, mapping: str, sort: bool = True) -> Iterator[Tuple[Any, pd.DataFrame]]:
+    """Split the data into groups, equivalent to iterating over data.groupby(mapping, sort=sort).
+
+    When the groups are already contiguous (e.g. because the data was ordered with _order_by_groups)
+    they are sliced out of the data without copying. Otherwise the data is reordered with a single
+    stable sort first. Like groupby, rows where the mapping is null are dropped and the order of rows
+    within each group is preserved.
+    """
+    codes, uniques = pd.factorize(data[mapping], sort=sort)
+    if len(codes) == 0:
+        return
+    starts, run_codes = _runs(codes)
+    if len(np.unique(run_codes)) != len(run_codes):
+        # At least one of the groups is split across multiple runs
+        order = np.argsort(codes, kind="stable")
+        data = data.take(order)
+        starts, run_codes = _runs(codes[order])
+    stops = np.append(starts[1:], len(codes))
+    names = uniques.tolist()
+    # Codes are either sorted by key or in order of appearance, i.e. the order groupby would use
+    for run in np.argsort(run_codes, kind="stable"):
+        start, stop = starts[run], stops[run]
+        if run_codes[run] < 0:
+            continue  # null keys
+        yield names[run_codes[run]], data.iloc[start:stop]
+
+
+def _group_positions(data: pd.DataFrame, mapping: str, sort: bool = True) -> Iterator[Tuple[Any, np.ndarray[Any, Any]]]:
+    """Like _group_by, but yield the positions of each group's rows rather than the rows themselves."""
+    codes, uniques = pd.factorize(data[mapping], sort=sort)
+    if len(codes) == 0:
+        return
+    order = np.argsort(codes, kind="stable")
+    starts, run_codes = _runs(codes[order])
+    stops = np.append(starts[1:], len(codes))
+    names = uniques.tolist()
+    for start, stop, code in zip(starts, stops, run_codes):
+        if code < 0:
+            continue  # null keys
+        yield names[code], order[start:stop]
+
+
+def _runs(codes: np.ndarray[Any, Any]) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    """The start positions and codes of each run of identical codes."""
+    starts = np.append(0, np.flatnonzero(codes[1:] != codes[:-1]) + 1)
+    return starts, codes[starts]
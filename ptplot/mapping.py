@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import abc
+import ast
+import operator
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import patsy
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+try:
+    import numexpr
+
+    _NUMEXPR_INSTALLED = True
+except ImportError:
+    _NUMEXPR_INSTALLED = False
+
+
+if TYPE_CHECKING:
+    from patsy import DesignInfo
+
+key_type = TypeVar("key_type", bound=Hashable)
+value_type = TypeVar("value_type")
+
+
+# Mappings are evaluated against the columns of the data and patsy's builtins (e.g. Q and I) only.
+# Capturing the caller's frame (patsy's default) would make every cached expression hold a reference
+# to whatever data happened to be in scope when it was first compiled.
+_EVAL_ENV = patsy.EvalEnvironment([{}])
+_NA_ACTION = patsy.NAAction(NA_types=[])
+
+
+class _LRUCache(Generic[key_type, value_type]):
+    """A minimal dictionary-backed cache that evicts the least recently used entry once full."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[key_type, value_type] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: key_type) -> Optional[value_type]:
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            return None
+        return self._entries[key]
+
+    def put(self, key: key_type, value: value_type) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class _CompiledMapping(abc.ABC):
+    """A mapping expression that has been parsed once and can be evaluated against any
+    dataset with the same schema as the one it was compiled with.
+
+    Parameters
+    ----------
+    mapping : The mapping expression.
+    """
+
+    def __init__(self, mapping: str):
+        self.mapping = mapping
+
+    @abc.abstractmethod
+    def evaluate(self, data: pd.DataFrame) -> pd.Series:
+        pass
+
+
+class _PatsyMapping(_CompiledMapping):
+    """A mapping evaluated by patsy, used for anything the native engine can't handle.
+
+    Parameters
+    ----------
+    mapping : The mapping expression.
+    design_info : The patsy design built from the expression.
+    """
+
+    def __init__(self, mapping: str, design_info: DesignInfo):
+        super().__init__(mapping)
+        self.design_info = design_info
+
+    @classmethod
+    def compile(cls, mapping: str, data: pd.DataFrame) -> Tuple[_PatsyMapping, pd.Series]:
+        """Parse the mapping against the data. Because patsy has to evaluate the expression
+        in order to work out its output columns, the evaluated data is returned as well."""
+        design_matrix = patsy.dmatrix(
+            f"I({mapping}) - 1", data, NA_action=_NA_ACTION, eval_env=_EVAL_ENV, return_type="dataframe"
+        )
+        compiled = cls(mapping, design_matrix.design_info)
+        return compiled, compiled._to_series(design_matrix)
+
+    def evaluate(self, data: pd.DataFrame) -> pd.Series:
+        (design_matrix,) = patsy.build_design_matrices(
+            [self.design_info], data, NA_action=_NA_ACTION, return_type="dataframe"
+        )
+        return self._to_series(design_matrix)
+
+    def _to_series(self, design_matrix: pd.DataFrame) -> pd.Series:
+        final_data = (
+            design_matrix[design_matrix.columns[0]]
+            if len(design_matrix.columns) == 1  # pure arithmetic
+            else design_matrix[design_matrix.columns[1]].astype(bool)  # conditional
+        )
+        final_data.name = self.mapping  # Have to explicitly assign the mapping as the name
+        return final_data
+
+
+# Below this many rows the overhead of handing an expression off to numexpr outweighs
+# its (multithreaded) evaluation speed.
+_NUMEXPR_MIN_ROWS = 100_000
+
+_BINARY_OPERATORS: Dict[type, Tuple[Callable[[Any, Any], Any], str]] = {
+    # Floor division and modulo are deliberately absent: pandas (and therefore patsy) fills
+    # division by zero with inf/NaN where numpy returns 0.
+    ast.Add: (operator.add, "+"),
+    ast.Sub: (operator.sub, "-"),
+    ast.Mult: (operator.mul, "*"),
+    ast.Div: (operator.truediv, "/"),
+    ast.Pow: (operator.pow, "**"),
+    ast.BitAnd: (operator.and_, "&"),
+    ast.BitOr: (operator.or_, "|"),
+    ast.BitXor: (operator.xor, "^"),
+}
+_UNARY_OPERATORS: Dict[type, Tuple[Callable[[Any], Any], str]] = {
+    ast.USub: (operator.neg, "-"),
+    ast.UAdd: (operator.pos, "+"),
+    ast.Invert: (operator.invert, "~"),
+}
+_COMPARISON_OPERATORS: Dict[type, Tuple[Callable[[Any, Any], Any], str]] = {
+    ast.Eq: (operator.eq, "=="),
+    ast.NotEq: (operator.ne, "!="),
+    ast.Lt: (operator.lt, "<"),
+    ast.LtE: (operator.le, "<="),
+    ast.Gt: (operator.gt, ">"),
+    ast.GtE: (operator.ge, ">="),
+}
+
+
+class _UnsupportedExpression(Exception):
+    pass
+
+
+class _Node:
+    """One node of a parsed expression.
+
+    Parameters
+    ----------
+    evaluate : Computes the value of the node given the referenced columns as arrays.
+    kind : "numeric" for numbers, booleans, and numeric/boolean columns, "object" for object columns,
+        and "string" for string literals.
+    numexpr : The equivalent numexpr expression, or None if it can't be expressed in numexpr.
+    """
+
+    def __init__(self, evaluate: Callable[[Dict[str, Any]], Any], kind: str, numexpr: Optional[str]):
+        self.evaluate = evaluate
+        self.kind = kind
+        self.numexpr = numexpr
+
+
+class _NumpyMapping(_CompiledMapping):
+    """A mapping evaluated directly on the NumPy arrays backing the data's columns.
+
+    Only a whitelisted subset of Python is supported: column names (including patsy-style
+    Q('...') quoting), numeric/boolean/string literals, arithmetic, bitwise operators, and single
+    comparisons. Anything else should be handed off to patsy.
+
+    Parameters
+    ----------
+    mapping : The mapping expression.
+    node : The root of the parsed expression.
+    columns : The names of all columns referenced by the expression, keyed by the variable
+        name used for them in the numexpr expression.
+    """
+
+    def __init__(self, mapping: str, node: _Node, columns: Dict[str, str]):
+        super().__init__(mapping)
+        self.node = node
+        self.columns = columns
+
+    @classmethod
+    def compile(cls, mapping: str, data: pd.DataFrame) -> _NumpyMapping:
+        try:
+            tree = ast.parse(mapping.strip(), mode="eval")
+        except SyntaxError as e:
+            raise _UnsupportedExpression(mapping) from e
+        columns: Dict[str, str] = {}
+        node = _parse_node(tree.body, data, columns)
+        if node.kind != "numeric" or len(columns) == 0:
+            raise _UnsupportedExpression(mapping)
+        return cls(mapping, node, columns)
+
+    def evaluate(self, data: pd.DataFrame) -> pd.Series:
+        arrays = {variable: data[column].to_numpy(copy=False) for variable, column in self.columns.items()}
+        result = None
+        if (
+            _NUMEXPR_INSTALLED
+            and self.node.numexpr is not None
+            and len(data) >= _NUMEXPR_MIN_ROWS
+            # numexpr's integer arithmetic doesn't match numpy's (and therefore patsy's): e.g. 0 to a
+            # negative power crashes the interpreter, and unsigned integers don't wrap around
+            and all(array.dtype.kind == "f" for array in arrays.values())
+        ):
+            try:
+                result = numexpr.evaluate(self.node.numexpr, local_dict=arrays, truediv=True)
+            except Exception:
+                # numexpr is pickier about types than numpy (e.g. bitwise operators on floats)
+                result = None
+        if result is None:
+            # Match pandas' handling of division by zero, overflow, etc.
+            with np.errstate(all="ignore"):
+                result = self.node.evaluate(arrays)
+        result = np.asarray(result)
+        if result.shape != (len(data),):
+            raise _UnsupportedExpression(self.mapping)
+        if result.dtype != np.bool_:
+            # patsy always returns numeric data as floats
+            result = result.astype(np.float64)
+        return pd.Series(result, index=data.index, name=self.mapping)
+
+
+def _constant_value(node: ast.AST) -> Any:
+    if sys.version_info < (3, 8):
+        if isinstance(node, ast.Num):
+            return node.n
+        if isinstance(node, ast.Str):
+            return node.s
+        if isinstance(node, ast.NameConstant):
+            return node.value
+    elif isinstance(node, ast.Constant):
+        return node.value
+    raise _UnsupportedExpression(ast.dump(node))
+
+
+def _column_node(column: str, data: pd.DataFrame, columns: Dict[str, str]) -> _Node:
+    if column not in data.columns:
+        # Could be a builtin, a typo, etc. Let patsy deal with it.
+        raise _UnsupportedExpression(column)
+    dtype = data[column].dtype
+    if not isinstance(dtype, np.dtype) or dtype.kind not in "biufO":
+        raise _UnsupportedExpression(column)
+    variable = next((variable for variable, name in columns.items() if name == column), f"column_{len(columns)}")
+    columns[variable] = column
+    kind = "object" if dtype.kind == "O" else "numeric"
+    return _Node(lambda arrays: arrays[variable], kind, variable if kind == "numeric" else None)
+
+
+def _parse_node(node: ast.AST, data: pd.DataFrame, columns: Dict[str, str]) -> _Node:
+    if isinstance(node, ast.Name):
+        return _column_node(node.id, data, columns)
+
+    if isinstance(node, ast.Call):
+        # Patsy's quoting syntax for columns with names that aren't valid Python: Q('column name')
+        if isinstance(node.func, ast.Name) and node.func.id == "Q" and len(node.args) == 1 and not node.keywords:
+            column = _constant_value(node.args[0])
+            if isinstance(column, str):
+                return _column_node(column, data, columns)
+        raise _UnsupportedExpression(ast.dump(node))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        function, symbol = _BINARY_OPERATORS[type(node.op)]
+        left = _parse_node(node.left, data, columns)
+        right = _parse_node(node.right, data, columns)
+        if left.kind != "numeric" or right.kind != "numeric":
+            raise _UnsupportedExpression(ast.dump(node))
+        return _Node(
+            lambda arrays: function(left.evaluate(arrays), right.evaluate(arrays)),
+            "numeric",
+            _combine_numexpr(symbol, left, right),
+        )
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        unary_function, unary_symbol = _UNARY_OPERATORS[type(node.op)]
+        operand = _parse_node(node.operand, data, columns)
+        if operand.kind != "numeric":
+            raise _UnsupportedExpression(ast.dump(node))
+        return _Node(
+            lambda arrays: unary_function(operand.evaluate(arrays)),
+            "numeric",
+            None if operand.numexpr is None else f"({unary_symbol}{operand.numexpr})",
+        )
+
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARISON_OPERATORS:
+        # Chained comparisons (a < b < c) don't work elementwise in plain Python, so aren't supported
+        comparison_function, comparison_symbol = _COMPARISON_OPERATORS[type(node.ops[0])]
+        left = _parse_node(node.left, data, columns)
+        right = _parse_node(node.comparators[0], data, columns)
+        kinds = {left.kind, right.kind}
+        if kinds != {"numeric"} and (
+            kinds == {"string"} or "numeric" in kinds or comparison_symbol not in ("==", "!=")
+        ):
+            # Strings and object columns can only be checked for (in)equality with each other
+            raise _UnsupportedExpression(ast.dump(node))
+        return _Node(
+            lambda arrays: comparison_function(left.evaluate(arrays), right.evaluate(arrays)),
+            "numeric",
+            _combine_numexpr(comparison_symbol, left, right),
+        )
+
+    value = _constant_value(node)
+    if isinstance(value, str):
+        return _Node(lambda arrays: value, "string", None)
+    if isinstance(value, (bool, int, float)):
+        return _Node(lambda arrays: value, "numeric", repr(value))
+    raise _UnsupportedExpression(ast.dump(node))
+
+
+def _combine_numexpr(symbol: str, left: _Node, right: _Node) -> Optional[str]:
+    if left.numexpr is None or right.numexpr is None:
+        return None
+    return f"({left.numexpr} {symbol} {right.numexpr})"
+
+
+def _compile_mapping(mapping: str, data: pd.DataFrame) -> Tuple[_CompiledMapping, Optional[pd.Series]]:
+    """Compile a mapping, preferring the native engine and falling back to patsy. If compiling
+    required evaluating the expression then the evaluated data is returned as well."""
+    try:
+        return _NumpyMapping.compile(mapping, data), None
+    except _UnsupportedExpression:
+        return _PatsyMapping.compile(mapping, data)
+
+
+_COMPILED_MAPPINGS: _LRUCache[Tuple[str, Tuple[Any, ...]], _CompiledMapping] = _LRUCache(256)
+
+
+def _schema(data: pd.DataFrame) -> Tuple[Any, ...]:
+    return tuple(zip(data.columns, data.dtypes))
+
+
+def _copy_on_write_enabled() -> bool:
+    """Whether pandas' copy-on-write mode is on, in which case selecting a column already
+    behaves like a copy without actually copying anything."""
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except KeyError:  # pandas < 1.5
+        return False
+
+
+def _read_only(series: pd.Series) -> pd.Series:
+    """A new Series backed by a read-only view of the input's data, so that it can be
+    shared without the risk of anything writing back into the original."""
+    values = series.to_numpy(copy=False)
+    if not isinstance(series.dtype, np.dtype):
+        # Extension arrays can't be reliably locked, so they get copied instead
+        return series.copy(deep=True)
+    view = values.view()
+    view.flags.writeable = False
+    return pd.Series(view, index=series.index, name=series.name, copy=False)
+
+
+def _shares_memory(series: pd.Series, data: pd.DataFrame) -> bool:
+    """Whether the series might be backed by the same memory as one of the data's columns."""
+    if not isinstance(series.dtype, np.dtype):
+        return True  # Can't tell for extension arrays, so assume it might
+    values = series.to_numpy(copy=False)
+    return any(
+        np.may_share_memory(values, data[column].to_numpy(copy=False))
+        for column, dtype in zip(data.columns, data.dtypes)
+        if isinstance(dtype, np.dtype)
+    )
+
+
+def _evaluate_mapping(data: pd.DataFrame, mapping: str, copy: bool = True) -> pd.Series:
+    """Evaluate a mapping expression, reusing the parsed expression from any previous evaluation
+    against data with the same schema.
+
+    Newly computed results are returned as they are. A result that's just one of the data's columns
+    (e.g. a boolean column wrapped in Q()) is copied, or if copy is False is a read-only view of it.
+    """
+    compiled = _COMPILED_MAPPINGS.get((mapping, _schema(data)))
+    result = None
+    if compiled is not None:
+        result = _try_evaluate(compiled, data)
+    if result is None:
+        compiled, result = _compile_mapping(mapping, data)
+        if result is None:
+            result = _try_evaluate(compiled, data)
+        if result is None:
+            # The native engine couldn't handle this data after all, so defer entirely to patsy.
+            compiled, result = _PatsyMapping.compile(mapping, data)
+        _COMPILED_MAPPINGS.put((mapping, _schema(data)), compiled)
+
+    if not _shares_memory(result, data):
+        return result
+    return result.copy(deep=True) if copy else _read_only(result)
+
+
+def _try_evaluate(compiled: _CompiledMapping, data: pd.DataFrame) -> Optional[pd.Series]:
+    try:
+        return compiled.evaluate(data)
+    except patsy.PatsyError:
+        # e.g. a categorical result with levels that weren't present when compiling
+        return None
+    except Exception:
+        if isinstance(compiled, _NumpyMapping):
+            # Let patsy either handle it or raise the same error it always has.
+            return None
+        raise
+
+
+def _clear_mapping_caches() -> None:
+    _COMPILED_MAPPINGS.clear()
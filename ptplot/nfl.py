@@ -60,6 +60,17 @@ def _ball_marker_generator(figure: figure) -> Callable[[figure], Callable[..., G
 class Aesthetics(_Aesthetics):
     """
     Team colors and ball colors/marker for the NFL.
+
+    Parameters
+    ----------
+    team_ball_mapping : The mapping with the team of each row (or the ball_identifier, for the ball).
+    home_away_mapping : The mapping that's True for home team rows and False for away team rows.
+    ball_identifier : The value of team_ball_mapping that marks the ball's rows.
+    vectorize : If True, put all the players (from both teams) in one data source per layer, with
+        each team and home/away group drawn by a glyph that filters out the rows of the others,
+        rather than giving every group its own data source. This cuts down on the number of data
+        sources and animation callbacks for the browser to handle, while the legend and muting
+        still work team by team. The number of glyphs stays the same.
     """
 
     team_color_mapping = NFL_TEAMS
@@ -1,6 +1,11 @@
 import * as p from "core/properties"
 import {Circle, CircleView, CircleData} from "models/glyphs/circle"
 import {Context2d} from "core/util/canvas"
+import {logger} from "core/logging"
+import {map} from "core/util/arrayable"
+import {BaseGLGlyph} from "models/glyphs/webgl/base"
+import {MarkerGL} from "models/glyphs/webgl/markers"
+import {Program} from "models/glyphs/webgl/utils"
 
 
 function _convert_to_bezier(x: number, y: number, radius: number,
@@ -33,42 +38,255 @@ function _generate_offsets(radius: number): [number, number, number] {
 }
 
 
+// Below this on-screen radius (in pixels) picks are drawn as plain circles, since their
+// orientation can't be made out anyway and arcs are much cheaper to draw than bezier curves
+const _LOD_RADIUS = 3
+
+
+// The WebGL version of the pick is a teardrop: a circle of radius PICK_RADIUS * radius, centered
+// PICK_OFFSET * radius in front of the marker's position, tapering to a rounded point (of radius
+// PICK_TIP_RADIUS * radius) centered PICK_TIP * radius in front of it. These were fit to the bezier
+// curve drawn by _convert_to_bezier, so the markers look the same with either backend. The shape is
+// worked out per pixel from its signed distance function, with each marker's rotation as a vertex
+// attribute.
+const PICK_VERTEX_SHADER = `
+precision mediump float;
+uniform float u_pixel_ratio;
+uniform vec2 u_canvas_size;
+uniform float u_antialias;
+attribute float a_sx;
+attribute float a_sy;
+attribute float a_size;
+attribute float a_angle;  // in radians
+attribute float a_linewidth;
+attribute vec4  a_fg_color;
+attribute vec4  a_bg_color;
+varying float v_linewidth;
+varying float v_size;
+varying vec4  v_fg_color;
+varying vec4  v_bg_color;
+varying vec2  v_direction;
+
+void main (void)
+{
+    v_size = a_size * u_pixel_ratio;
+    v_linewidth = a_linewidth * u_pixel_ratio;
+    v_fg_color = a_fg_color;
+    v_bg_color = a_bg_color;
+    // The direction the tip points in, in screen coordinates (same as _convert_to_bezier)
+    v_direction = vec2(-sin(a_angle), -cos(a_angle));
+    vec2 pos = vec2(a_sx, a_sy);  // in pixels
+    pos += 0.5;  // make up for Bokeh's offset
+    pos /= u_canvas_size / u_pixel_ratio;  // in 0..1
+    gl_Position = vec4(pos*2.0-1.0, 0.0, 1.0);
+    gl_Position.y *= -1.0;
+    // The tip sticks out past the radius, so the point has to be big enough to fit it
+    gl_PointSize = 1.6 * v_size + 2.0 * (v_linewidth + 1.5*u_antialias);
+}
+`
+
+const PICK_FRAGMENT_SHADER = `
+precision mediump float;
+const float PICK_RADIUS = 0.95;
+const float PICK_OFFSET = 0.05;
+const float PICK_TIP = 1.15;
+const float PICK_TIP_RADIUS = 0.2;
+uniform float u_antialias;
+varying vec4  v_fg_color;
+varying vec4  v_bg_color;
+varying float v_linewidth;
+varying float v_size;
+varying vec2  v_direction;
+
+// https://iquilezles.org/www/articles/distfunctions2d/distfunctions2d.htm (uneven capsule)
+float marker(vec2 P, float radius)
+{
+    // Line the capsule up with the direction of the tip, starting from the center of the circle
+    vec2 p = vec2(abs(dot(P, vec2(v_direction.y, -v_direction.x))), dot(P, v_direction) - PICK_OFFSET * radius);
+    float r1 = PICK_RADIUS * radius;
+    float r2 = PICK_TIP_RADIUS * radius;
+    float h = (PICK_TIP - PICK_OFFSET) * radius;
+    float b = (r1 - r2) / h;
+    float a = sqrt(1.0 - b*b);
+    float k = dot(p, vec2(-b, a));
+    if (k < 0.0)
+        return length(p) - r1;
+    if (k > a*h)
+        return length(p - vec2(0.0, h)) - r2;
+    return dot(p, vec2(a, b)) - r1;
+}
+
+vec4 outline(float distance, float linewidth, float antialias, vec4 fg_color, vec4 bg_color)
+{
+    vec4 frag_color;
+    float t = linewidth/2.0 - antialias;
+    float border_distance = abs(distance) - t;
+    float alpha = border_distance/antialias;
+    alpha = exp(-alpha*alpha);
+
+    // Without an outline (or a fill), use the other color to avoid dark edges from antialiasing
+    float select = float(bool(fg_color.a));
+    fg_color.rgb = select * fg_color.rgb + (1.0  - select) * bg_color.rgb;
+    select = float(bool(bg_color.a));
+    bg_color.rgb = select * bg_color.rgb + (1.0  - select) * fg_color.rgb;
+
+    if (border_distance < 0.0)
+        frag_color = fg_color;
+    else if (distance < 0.0)
+        frag_color = mix(bg_color, fg_color, sqrt(alpha));
+    else if (abs(distance) < (linewidth/2.0 + antialias))
+        frag_color = vec4(fg_color.rgb, fg_color.a * alpha);
+    else
+        discard;
+    return frag_color;
+}
+
+void main()
+{
+    float point_size = 1.6 * v_size + 2.0 * (v_linewidth + 1.5*u_antialias);
+    vec2 P = (gl_PointCoord.xy - vec2(0.5, 0.5)) * point_size;
+    gl_FragColor = outline(marker(P, v_size / 2.0), v_linewidth, u_antialias, v_fg_color, v_bg_color);
+}
+`
+
+
+export class PickGL extends MarkerGL {
+  readonly glyph: PickView
+
+  constructor(gl: WebGLRenderingContext, glyph: PickView) {
+    // Reuses all of the circle marker's buffers and drawing, with the pick's own shaders
+    super(gl, glyph, "circle")
+    this.prog = new Program(gl)
+    this.prog.set_shaders(PICK_VERTEX_SHADER, PICK_FRAGMENT_SHADER)
+    this.prog.set_attribute("a_sx", "float", this.vbo_sx)
+    this.prog.set_attribute("a_sy", "float", this.vbo_sy)
+    this.prog.set_attribute("a_size", "float", this.vbo_s)
+    this.prog.set_attribute("a_angle", "float", this.vbo_a)
+  }
+
+  protected _set_data(nvertices: number): void {
+    super._set_data(nvertices)
+    // Rotations are in degrees, like on the canvas
+    this.vbo_a.set_data(0, new Float32Array(map(this.glyph.rot.array, (rot) => rot * Math.PI / 180)))
+  }
+}
+
+
 export type PickData = CircleData & {
   rot: p.UniformVector<number>
 }
 
-export interface PickView extends PickData {}
+export interface PickView extends PickData {
+  // Set up by GlyphView when drawing with WebGL, but left out of Bokeh's type declarations
+  glglyph?: BaseGLGlyph
+}
 
 export class PickView extends CircleView {
   model: Pick
   visuals: Pick.Visuals
 
+  initialize(): void {
+    super.initialize()
+    const {webgl} = this.renderer.plot_view.canvas_view
+    if (webgl != null) {
+      // Without this, the circle marker set up by CircleView would be drawn instead of the pick.
+      // If the pick's shaders can't be used, fall back to drawing on the canvas.
+      try {
+        this.glglyph = new PickGL(webgl.gl, this)
+      } catch (error) {
+        logger.warn(`WebGL picks are unavailable, drawing them on the canvas instead: ${error}`)
+        this.glglyph = undefined
+      }
+    }
+  }
+
   protected _render(ctx: Context2d, indices: number[], data?: PickData): void {
+    if (this._has_uniform_visuals())
+      this._render_batched(ctx, indices, data)
+    else
+      this._render_each(ctx, indices, data)
+  }
+
+  protected _has_uniform_visuals(): boolean {
+    // Every marker looks the same unless one of the visual properties maps to a column
+    for (const visual of [this.visuals.line, this.visuals.fill, this.visuals.hatch]) {
+      for (const attr of visual.attrs) {
+        if (!(visual as any)[attr].is_Scalar())
+          return false
+      }
+    }
+    return true
+  }
+
+  protected _add_marker(ctx: Context2d, sx: number, sy: number, sradius: number, rot: number): void {
+    if (sradius < _LOD_RADIUS) {
+      ctx.moveTo(sx + sradius, sy)
+      ctx.arc(sx, sy, sradius, 0, 2 * Math.PI, false)
+    } else {
+      const [x0, y0, cx0, cx1, cy0, cy1] = _convert_to_bezier(sx, sy, sradius, rot)
+      ctx.moveTo(x0, y0)
+      ctx.bezierCurveTo(cx0, cy0, cx1, cy1, x0, y0)
+    }
+  }
+
+  protected _render_batched(ctx: Context2d, indices: number[], data?: PickData): void {
+    // With uniform visuals all the markers go into a single path, which is filled and stroked
+    // once, rather than setting the visuals and drawing each marker separately
     const {sx, sy, sradius} = data ?? this
 
     const rot = this.rot.array
 
+    ctx.beginPath()
+    let first: number | null = null
     for (const i of indices) {
       const sx_i = sx[i]
       const sy_i = sy[i]
-      const rot_i = rot[i]
       const sradius_i = sradius[i]
 
       if (!isFinite(sx_i + sy_i + sradius_i))
         continue
 
-      const [x0, y0, cx0, cx1, cy0, cy1] = _convert_to_bezier(
-        sx_i, sy_i, sradius_i, rot_i
-      )
+      this._add_marker(ctx, sx_i, sy_i, sradius_i, rot[i])
+      if (first == null)
+        first = i
+    }
+    if (first == null)
+      return
+
+    // Stroke last: filling the whole path after stroking it would paint over the outlines of
+    // any markers that overlap their neighbours
+    if (this.visuals.fill.doit) {
+      this.visuals.fill.set_vectorize(ctx, first)
+      ctx.fill()
+    }
+    if (this.visuals.hatch.doit) {
+      this.visuals.hatch.set_vectorize(ctx, first)
+      ctx.fill()
+    }
+    if (this.visuals.line.doit) {
+      this.visuals.line.set_vectorize(ctx, first)
+      ctx.stroke()
+    }
+  }
+
+  protected _render_each(ctx: Context2d, indices: number[], data?: PickData): void {
+    const {sx, sy, sradius} = data ?? this
+
+    const rot = this.rot.array
+
+    for (const i of indices) {
+      const sx_i = sx[i]
+      const sy_i = sy[i]
+      const rot_i = rot[i]
+      const sradius_i = sradius[i]
+
+      if (!isFinite(sx_i + sy_i + sradius_i))
+        continue
 
       ctx.beginPath()
-      ctx.moveTo(x0, y0)
-      ctx.bezierCurveTo(cx0, cy0, cx1, cy1, x0, y0)
+      this._add_marker(ctx, sx_i, sy_i, sradius_i, rot_i)
 
-      if (this.visuals.line.doit) {
-        this.visuals.line.set_vectorize(ctx, i)
-        ctx.stroke()
-      }
+      // Same order as _render_batched, so a marker looks the same whichever way it's drawn
       if (this.visuals.fill.doit) {
         this.visuals.fill.set_vectorize(ctx, i)
         ctx.fill()
@@ -77,6 +295,10 @@ export class PickView extends CircleView {
         this.visuals.hatch.set_vectorize(ctx, i)
         ctx.fill()
       }
+      if (this.visuals.line.doit) {
+        this.visuals.line.set_vectorize(ctx, i)
+        ctx.stroke()
+      }
     }
   }
 }
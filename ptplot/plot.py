@@ -1,11 +1,22 @@
 from __future__ import annotations
 
-from bokeh.models import ColumnDataSource, CustomJS
-from bokeh.plotting._decorators import glyph_method
-from typing import TYPE_CHECKING, Any, Callable, Sequence, Optional
+import numpy as np
+
+import pandas as pd
 
-from ptplot.callback import FIND_CURRENT_FRAME, FIND_ALL_FRAMES_UP_TO_CURRENT_FRAME
+from bokeh.models import CDSView, ColumnDataSource, CustomJS, IndexFilter
+from bokeh.plotting._decorators import glyph_method
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Sequence, Optional, Tuple
+
+from ptplot.callback import (
+    FILTER_CURRENT_FRAME,
+    FIND_CURRENT_FRAME,
+    FIND_ALL_FRAMES_UP_TO_CURRENT_FRAME,
+    INTERPOLATE_CURRENT_FRAME,
+    REQUEST_CURRENT_FRAME,
+)
 from ptplot.core import Layer, _Metadata
+from ptplot.grouping import _group_positions
 from ptplot.pick import Pick
 from ptplot.utils import _union_kwargs
 
@@ -13,7 +24,87 @@ if TYPE_CHECKING:
     from bokeh.plotting import figure
     from bokeh.models import GlyphRenderer
     from .ptplot import PTPlot
-    import pandas as pd
+
+
+def _frame_offsets(frames: Sequence[Any], initial_frame: Any, include_starts: bool = True) -> ColumnDataSource:
+    """Find where each frame of an animation starts and ends in a source's rows.
+
+    Frame k is the animation slider's kth step, initial_frame + k, and its rows run from start[k] up to
+    (but not including) end[k]. The frames must be sorted. Callbacks that always start from the first
+    row can leave out the starts, to keep the document smaller.
+    """
+    sorted_frames = np.asarray(frames)
+    num_steps = 0 if len(sorted_frames) == 0 else max(int(np.floor(sorted_frames[-1] - initial_frame)) + 1, 0)
+    steps = initial_frame + np.arange(num_steps)
+    offsets = {"end": np.searchsorted(sorted_frames, steps, side="right").astype(np.int32)}
+    if include_starts:
+        offsets["start"] = np.searchsorted(sorted_frames, steps, side="left").astype(np.int32)
+    return ColumnDataSource(offsets)
+
+
+def _track_frame_offsets(track_frames: Sequence[np.ndarray[Any, Any]], initial_frame: Any) -> ColumnDataSource:
+    """Find where each frame of an animation ends in each of a set of tracks.
+
+    Like _frame_offsets, but for multiple tracks at once: the number of points track t has up to
+    and including frame k (the animation slider's kth step) is end[k * num_tracks + t]. Each
+    track's frames must be sorted.
+    """
+    last_frame = max((frames[-1] for frames in track_frames if len(frames) > 0), default=initial_frame - 1)
+    num_steps = max(int(np.floor(last_frame - initial_frame)) + 1, 0)
+    steps = initial_frame + np.arange(num_steps)
+    ends = np.empty((num_steps, len(track_frames)), dtype=np.int32)
+    for track, frames in enumerate(track_frames):
+        ends[:, track] = np.searchsorted(frames, steps, side="right")
+    return ColumnDataSource({"end": ends.ravel()})
+
+
+def _constant_columns(data: pd.DataFrame, track_rows: Sequence[np.ndarray[Any, Any]]) -> Sequence[str]:
+    """The columns whose values never change within a track (e.g. the player's name, but not their speed)."""
+    if len(track_rows) == 0:
+        return list(data.columns)
+    tracks = np.repeat(np.arange(len(track_rows)), [len(rows) for rows in track_rows])
+    num_values = data.iloc[np.concatenate(track_rows)].groupby(tracks).nunique(dropna=False)
+    return num_values.columns[(num_values <= 1).all()].tolist()
+
+
+def _frame_store(data: pd.DataFrame, metadata: _Metadata) -> ColumnDataSource:
+    """The source with all the rows of an aesthetic group (sorted by frame), which every animated layer
+    drawing the group uses as the full data to take each frame's rows from."""
+    if metadata.frame_store is None:
+        metadata.frame_store = ColumnDataSource(data)
+    return metadata.frame_store
+
+
+def _subgroup_views(source: ColumnDataSource, metadata: _Metadata) -> Iterator[Tuple[_Metadata, Dict[str, Any]]]:
+    """The metadata of each glyph to draw for an aesthetic group, along with the view (if any) that picks out
+    its rows from the source, which all the glyphs share."""
+    if len(metadata.subgroups) == 0:
+        yield metadata, {}
+    for subgroup in metadata.subgroups:
+        yield subgroup, {"view": CDSView(source=source, filters=[subgroup.view_filter])}
+
+
+def _next_rows(entities: Sequence[Any]) -> np.ndarray[Any, Any]:
+    """Find the next row with the same entity as each row, or -1 if there isn't one.
+
+    The rows must be sorted by frame, so the next row is the entity in the next frame it appears in.
+    """
+    codes = pd.factorize(np.asarray(entities))[0]
+    order = np.argsort(codes, kind="stable")
+    is_same_entity = codes[order[1:]] == codes[order[:-1]]
+    next_rows = np.full(len(codes), -1, dtype=np.int32)
+    next_rows[order[:-1][is_same_entity]] = order[1:][is_same_entity]
+    return next_rows
+
+
+def _with_sentinel(data: pd.DataFrame, hidden_columns: Sequence[str]) -> pd.DataFrame:
+    """Append an invisible row to the data, by copying the first row with the hidden columns set to NaN."""
+    if len(data) == 0:
+        return data
+    sentinel = data.iloc[:1].copy()
+    for column in hidden_columns:
+        sentinel[column] = np.nan
+    return pd.concat([data, sentinel])
 
 
 class Tracks(Layer):
@@ -32,8 +123,9 @@ class Tracks(Layer):
     animate : If True and an Animation layer is provided to the plot, animate the tracks. If False, show the
         full tracks even if an Animation layer is provided.
     name : If you plan on using the Hover layer, provide a name for the layer in order to assign hoverlabels
-        to the glyphs drawn by this layer.
-    kwargs : Any additional keyword arguments to bokeh.figure.lines.
+        to the glyphs drawn by this layer. Each track has one hoverlabel, so it can only show columns that
+        stay the same for the whole track (e.g. the player's name or team, but not their speed).
+    kwargs : Any additional keyword arguments to bokeh.figure.multi_line.
     """
 
     def __init__(
@@ -50,17 +142,29 @@ class Tracks(Layer):
     def get_mappings(self) -> Sequence[str]:
         return [self.x, self.y, self.track_mapping]
 
-    def set_up_animation(self, graphics: GlyphRenderer) -> Callable[[str, Any], CustomJS]:
+    def set_up_animation(
+        self, graphics: GlyphRenderer, full_source: ColumnDataSource, track_rows: Sequence[np.ndarray[Any, Any]]
+    ) -> Callable[[str, Any], CustomJS]:
         source = graphics.data_source
-        full_source = ColumnDataSource(source.data)
+        track_starts = np.append(0, np.cumsum([len(rows) for rows in track_rows]))
 
         def animate(frame_column: str, initial_frame: Any) -> CustomJS:
-            is_in_initial_frame = source.data[frame_column] <= initial_frame
-            initial_data = {column: source.data[column][is_in_initial_frame] for column in source.data}
-            source.data = initial_data
+            full_frames = np.asarray(full_source.data[frame_column])
+            frame_offsets = _track_frame_offsets([full_frames[rows] for rows in track_rows], initial_frame)
+            for column in [self.x, self.y]:
+                initial_ends = frame_offsets.data["end"][: len(track_rows)]
+                source.data[column] = [track[:end] for track, end in zip(source.data[column], initial_ends)]
 
             callback = CustomJS(
-                args={"source": source, "full_source": full_source, "frame_column": frame_column}, code=self.callback
+                args={
+                    "source": source,
+                    "full_source": full_source,
+                    "track_rows": ColumnDataSource({"rows": np.concatenate(track_rows).astype(np.int32)}),
+                    "track_starts": track_starts.tolist(),
+                    "frame_offsets": frame_offsets,
+                    "line_columns": [self.x, self.y],
+                },
+                code=self.callback,
             )
             return callback
 
@@ -70,29 +174,39 @@ class Tracks(Layer):
         self, ptplot: PTPlot, data: pd.DataFrame, bokeh_figure: figure, metadata: _Metadata
     ) -> Optional[Sequence[Callable[[str, Any], CustomJS]]]:
 
-        line_color = metadata.color_list[0] if metadata.is_home is True else metadata.color_list[1]
-        groups = data.groupby(self.track_mapping)
-        all_graphics = []
-        for group_name, group_data in groups:
-            source = ColumnDataSource(group_data)
+        track_rows = [rows for _, rows in _group_positions(data, self.track_mapping)]
+        if len(track_rows) == 0:
+            return None
+
+        # All the tracks are drawn as a single glyph, where x and y hold each track's points and every
+        # other column has one value per track (e.g. for hover labels). Columns that change during a
+        # track can't be shown that way, so they're left out
+        first_rows = [rows[0] for rows in track_rows]
+        source_data = {column: data[column].to_numpy()[first_rows] for column in _constant_columns(data, track_rows)}
+        for column in [self.x, self.y]:
+            values = data[column].to_numpy()
+            source_data[column] = [values[rows] for rows in track_rows]
+        source = ColumnDataSource(source_data)
+        for group, view_kwargs in _subgroup_views(source, metadata):
+            line_color = group.color_list[0] if group.is_home is True else group.color_list[1]
             kwargs = _union_kwargs(
                 {
-                    "x": self.x,
-                    "y": self.y,
+                    "xs": self.x,
+                    "ys": self.y,
                     "source": source,
                     "line_color": line_color,
-                    "legend_label": metadata.label,
+                    "legend_label": group.label,
                     "name": self.name,
+                    **view_kwargs,
                 },
                 self.kwargs,
             )
-            graphics = bokeh_figure.line(**kwargs)
-            all_graphics.append(graphics)
+            graphics = bokeh_figure.multi_line(**kwargs)
 
         if self.animate is False:
             return None
         else:
-            return [self.set_up_animation(graphics) for graphics in all_graphics]
+            return [self.set_up_animation(graphics, _frame_store(data, metadata), track_rows)]
 
 
 class Positions(Layer):
@@ -141,6 +255,9 @@ class Positions(Layer):
         self.number = number
         self.frame_filter = frame_filter
         self.callback = FIND_CURRENT_FRAME
+        self.view_callback = FILTER_CURRENT_FRAME
+        self.interpolation_callback = INTERPOLATE_CURRENT_FRAME
+        self.worker_callback = REQUEST_CURRENT_FRAME
         self.marker_radius = marker_radius
         self.name = name
         self.kwargs = kwargs
@@ -156,17 +273,66 @@ class Positions(Layer):
             mappings += [self.number]
         return mappings
 
-    def set_up_animation(self, graphics: GlyphRenderer) -> Callable[[str, Any], CustomJS]:
+    def get_frame_filter(self) -> Optional[str]:
+        return self.frame_filter
+
+    def set_up_animation(
+        self,
+        graphics: GlyphRenderer,
+        full_source: ColumnDataSource,
+        entity_mapping: Optional[str] = None,
+        use_worker: bool = False,
+    ) -> Callable[[str, Any], CustomJS]:
         source = graphics.data_source
-        full_source = ColumnDataSource(source.data)
 
         def animate(frame_column: str, initial_frame: Any) -> CustomJS:
             is_in_initial_frame = source.data[frame_column] <= initial_frame
             initial_data = {column: source.data[column][is_in_initial_frame] for column in source.data}
             source.data = initial_data
 
+            args = {
+                "source": source,
+                "full_source": full_source,
+                "frame_offsets": _frame_offsets(full_source.data[frame_column], initial_frame),
+            }
+            if entity_mapping is None and not use_worker:
+                return CustomJS(args=args, code=self.callback)
+
+            # Interpolate between keyframes
+            args.update(
+                next_rows=(
+                    ColumnDataSource({"next": _next_rows(full_source.data[entity_mapping])})
+                    if entity_mapping is not None
+                    else None
+                ),
+                frame_column=frame_column,
+                interpolated=[self.x, self.y],
+                angles=[self.orientation] if self.orientation is not None else [],
+            )
+            return CustomJS(args=args, code=self.worker_callback if use_worker else self.interpolation_callback)
+
+        return animate
+
+    def set_up_view_animation(self, graphics: GlyphRenderer) -> Callable[[str, Any], CustomJS]:
+        source = graphics.data_source
+        view = graphics.view
+        index_filter = view.filters[0]
+        # The last row is the sentinel added by _with_sentinel
+        sentinel = len(source.data[self.x]) - 1
+
+        def animate(frame_column: str, initial_frame: Any) -> CustomJS:
+            frame_offsets = _frame_offsets(source.data[frame_column][:sentinel], initial_frame)
+            start, end = (frame_offsets.data["start"][0], frame_offsets.data["end"][0]) if sentinel > 0 else (0, 0)
+            index_filter.indices = list(range(start, end)) + [sentinel]
+
             callback = CustomJS(
-                args={"source": source, "full_source": full_source, "frame_column": frame_column}, code=self.callback
+                args={
+                    "view": view,
+                    "index_filter": index_filter,
+                    "frame_offsets": frame_offsets,
+                    "sentinel": sentinel,
+                },
+                code=self.view_callback,
             )
             return callback
 
@@ -176,61 +342,92 @@ class Positions(Layer):
         self, ptplot: PTPlot, data: pd.DataFrame, bokeh_figure: figure, metadata: _Metadata
     ) -> Optional[Sequence[Callable[[str, Any], CustomJS]]]:
 
+        animation_layer = ptplot.animation_layer
         # If you have multiple frames but only want to show one (even in an animation):
         if self.frame_filter is not None:
             data = data[data[self.frame_filter]]
-        source = ColumnDataSource(data)
-
-        all_kwargs = _union_kwargs(
-            {"x": self.x, "y": self.y, "source": source, "legend_label": metadata.label, "name": self.name}, self.kwargs
-        )
-
-        if metadata.marker is not None:
-            graphics = metadata.marker(bokeh_figure)(**all_kwargs)
+            use_view = False
         else:
-            fill_color, line_color = (
-                metadata.color_list if metadata.is_home is True else ["white", metadata.color_list[0]]
-            )
-            player_kwargs = _union_kwargs(
-                {"fill_color": fill_color, "line_color": line_color, "radius": self.marker_radius}, all_kwargs
+            # Glyphs that share their source with other groups already filter it by group, so can't use views
+            use_view = (
+                animation_layer is not None
+                and animation_layer.mode == "view"
+                and not animation_layer.interpolate
+                and len(data) > 0
+                and len(metadata.subgroups) == 0
             )
-            if self.orientation is None:
-                graphics = bokeh_figure.circle(**player_kwargs)
-            else:
-                # This is a kludge to let me take advantage of the bokeh all-in-one
-                # figure.plot_name syntax, which handles adding the source, making the legends,
-                # etc.
-                def pick(**kwargs: Any) -> None:
-                    pass
-
-                decorated_pick = glyph_method(Pick)(pick)
 
-                player_kwargs = _union_kwargs({"rot": self.orientation}, player_kwargs)
-                graphics = decorated_pick(bokeh_figure, **player_kwargs)
+        if use_view:
+            # This can't be the shared frame store, since it needs the sentinel row, so the document
+            # ends up with a second copy of the group's data
+            source = ColumnDataSource(_with_sentinel(data, [self.x, self.y]))
+            groups = [(metadata, {"view": CDSView(source=source, filters=[IndexFilter()])})]
+        else:
+            source = ColumnDataSource(data)
+            groups = list(_subgroup_views(source, metadata))
 
-        if self.number is not None:
-            # https://github.com/bokeh/bokeh/issues/2439#issuecomment-447498732
-            text_color = "white" if metadata.is_home is True else "black"
-
-            # This is a total kludge to scale font size up and down with plot size,
-            # based on a font size I found to work reasonably well with two-digit
-            # numbers
-            pixels_per_data_unit = bokeh_figure.height / abs(bokeh_figure.y_range.end - bokeh_figure.y_range.start)
-            font_size = pixels_per_data_unit * self.marker_radius
-
-            bokeh_figure.text(
-                x=self.x,
-                y=self.y,
-                text=self.number,
-                source=source,
-                text_color=text_color,
-                text_align="center",
-                text_baseline="middle",
-                text_font_size=f"{font_size:.2f}px",
+        for group, view_kwargs in groups:
+            all_kwargs = _union_kwargs(
+                {
+                    "x": self.x,
+                    "y": self.y,
+                    "source": source,
+                    "legend_label": group.label,
+                    "name": self.name,
+                    **view_kwargs,
+                },
+                self.kwargs,
             )
-            # Don't need to set up a separate animation for the numbers because the source, view, and callback are
-            # all the same
+
+            if group.marker is not None:
+                graphics = group.marker(bokeh_figure)(**all_kwargs)
+            else:
+                fill_color, line_color = group.color_list if group.is_home is True else ["white", group.color_list[0]]
+                player_kwargs = _union_kwargs(
+                    {"fill_color": fill_color, "line_color": line_color, "radius": self.marker_radius}, all_kwargs
+                )
+                if self.orientation is None:
+                    graphics = bokeh_figure.circle(**player_kwargs)
+                else:
+                    # This is a kludge to let me take advantage of the bokeh all-in-one
+                    # figure.plot_name syntax, which handles adding the source, making the legends,
+                    # etc.
+                    def pick(**kwargs: Any) -> None:
+                        pass
+
+                    decorated_pick = glyph_method(Pick)(pick)
+
+                    player_kwargs = _union_kwargs({"rot": self.orientation}, player_kwargs)
+                    graphics = decorated_pick(bokeh_figure, **player_kwargs)
+
+            if self.number is not None:
+                # https://github.com/bokeh/bokeh/issues/2439#issuecomment-447498732
+                # This is a total kludge to scale font size up and down with plot size,
+                # based on a font size I found to work reasonably well with two-digit
+                # numbers
+                pixels_per_data_unit = bokeh_figure.height / abs(bokeh_figure.y_range.end - bokeh_figure.y_range.start)
+                font_size = pixels_per_data_unit * self.marker_radius
+
+                bokeh_figure.text(
+                    x=self.x,
+                    y=self.y,
+                    text=self.number,
+                    source=source,
+                    text_color="white" if group.is_home is True else "black",
+                    text_align="center",
+                    text_baseline="middle",
+                    text_font_size=f"{font_size:.2f}px",
+                    **view_kwargs,
+                )
+                # Don't need to set up a separate animation for the numbers because the source, view, and
+                # callback are all the same
         if self.frame_filter is not None:
             return None
+        elif use_view:
+            return [self.set_up_view_animation(graphics)]
+        elif animation_layer is not None:
+            entity_mapping = animation_layer.entity_mapping if animation_layer.interpolate else None
+            use_worker = animation_layer.mode == "worker"
+            return [self.set_up_animation(graphics, _frame_store(data, metadata), entity_mapping, use_worker)]
         else:
-            return [self.set_up_animation(graphics)]
+            return [self.set_up_animation(graphics, _frame_store(data, metadata))]
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import time
+import tracemalloc
+
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from ptplot.core import Layer
+
+
+@dataclass
+class Measurement:
+    """Timing and memory usage for one part of drawing a visualization.
+
+    Parameters
+    ----------
+    name : What was measured.
+    calls : How many times it ran.
+    wall_time : The total time it took, in seconds.
+    peak_memory : The most memory allocated at once during any single call, in bytes. None if memory
+        wasn't traced.
+    """
+
+    name: str
+    calls: int = 0
+    wall_time: float = 0.0
+    peak_memory: Optional[int] = None
+
+
+@dataclass
+class LayerMeasurement(Measurement):
+    """Timing and memory usage for all the calls to one layer's draw method.
+
+    Parameters
+    ----------
+    layer : The layer that was measured.
+    """
+
+    layer: Optional[Layer] = None
+
+
+@dataclass
+class DrawProfile:
+    """A report on where the time and memory went when drawing visualizations.
+
+    Parameters
+    ----------
+    total : The measurement for PTPlot.draw as a whole.
+    phases : The measurement for each phase of drawing, in the order they first ran:
+        "mappings" (evaluating the mappings), "grouping" (splitting the data into facets and
+        aesthetic groups), "figures" (creating the Bokeh figures), "layers" (calling every layer's
+        draw method), "layout" (arranging the figures) and "animation" (setting up the animation
+        widgets and callbacks).
+    layers : The measurement for each layer instance, in the order they were first drawn.
+    """
+
+    total: Measurement = field(default_factory=lambda: Measurement("total"))
+    phases: Dict[str, Measurement] = field(default_factory=dict)
+    layers: List[LayerMeasurement] = field(default_factory=list)
+    _layers_by_id: Dict[int, LayerMeasurement] = field(default_factory=dict, repr=False, compare=False)
+
+    def phase(self, name: str) -> Measurement:
+        if name not in self.phases:
+            self.phases[name] = Measurement(name)
+        return self.phases[name]
+
+    def layer(self, layer: Layer) -> LayerMeasurement:
+        if id(layer) not in self._layers_by_id:
+            measurement = LayerMeasurement(f"{type(layer).__name__} (layer {len(self.layers)})", layer=layer)
+            self._layers_by_id[id(layer)] = measurement
+            self.layers.append(measurement)
+        return self._layers_by_id[id(layer)]
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Flatten the report into one dictionary per measurement, e.g. for sending to a metrics system."""
+        records = [{"kind": "total", **_as_record(self.total)}]
+        records += [{"kind": "phase", **_as_record(measurement)} for measurement in self.phases.values()]
+        records += [{"kind": "layer", **_as_record(measurement)} for measurement in self.layers]
+        return records
+
+    def __str__(self) -> str:
+        lines = [f"{'':<40}{'calls':>8}{'time (s)':>12}{'peak (MiB)':>12}"]
+        for record in self.to_records():
+            name = record["name"] if record["kind"] != "layer" else f"  {record['name']}"
+            peak = "" if record["peak_memory"] is None else f"{record['peak_memory'] / 2 ** 20:.2f}"
+            lines.append(f"{name:<40}{record['calls']:>8}{record['wall_time']:>12.4f}{peak:>12}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling(hook: Optional[Callable[[DrawProfile], None]] = None, trace_memory: bool = True) -> Iterator[DrawProfile]:
+    """Profile every call to PTPlot.draw made inside the block.
+
+    Tracing memory makes drawing noticeably slower, so the wall times are most accurate with it
+    turned off. On Python 3.8 and earlier peak memory can only be measured from when tracing
+    started, so each peak is an upper bound.
+
+    Parameters
+    ----------
+    hook : If set, called with the completed report when the block exits without an error.
+    trace_memory : Whether to record peak memory usage, using tracemalloc.
+
+    Returns
+    -------
+    The report, which is filled in as visualizations are drawn.
+    """
+    report = DrawProfile()
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = _ACTIVE_PROFILER.set(_Profiler(report, trace_memory))
+    try:
+        yield report
+    finally:
+        _ACTIVE_PROFILER.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+    if hook is not None:
+        hook(report)
+
+
+class _Profiler:
+    def __init__(self, report: DrawProfile, trace_memory: bool):
+        self.report = report
+        self.trace_memory = trace_memory
+        # The highest memory usage seen so far by each measurement in progress, outermost first
+        self._peaks: List[int] = []
+
+    @contextmanager
+    def measure(self, measurement: Measurement) -> Iterator[None]:
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        start_memory = 0
+        if tracing:
+            start_memory, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak for this measurement would lose the enclosing one's, so save it first
+            if len(self._peaks) > 0:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            _reset_peak()
+            self._peaks.append(start_memory)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            measurement.wall_time += time.perf_counter() - start_time
+            measurement.calls += 1
+            if tracing:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                measurement.peak_memory = max(measurement.peak_memory or 0, peak - start_memory)
+                if len(self._peaks) > 0:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+
+
+_ACTIVE_PROFILER: ContextVar[Optional[_Profiler]] = ContextVar("ptplot_profiler", default=None)
+
+
+def _measure_draw() -> ContextManager[None]:
+    profiler = _ACTIVE_PROFILER.get()
+    return nullcontext() if profiler is None else profiler.measure(profiler.report.total)
+
+
+def _measure_phase(name: str) -> ContextManager[None]:
+    profiler = _ACTIVE_PROFILER.get()
+    return nullcontext() if profiler is None else profiler.measure(profiler.report.phase(name))
+
+
+def _measure_layer(layer: Layer) -> ContextManager[None]:
+    profiler = _ACTIVE_PROFILER.get()
+    return nullcontext() if profiler is None else profiler.measure(profiler.report.layer(layer))
+
+
+def _reset_peak() -> None:
+    # tracemalloc.reset_peak was added in Python 3.9
+    reset_peak = getattr(tracemalloc, "reset_peak", None)
+    if reset_peak is not None:
+        reset_peak()
+
+
+def _as_record(measurement: Measurement) -> Dict[str, Any]:
+    return {
+        "name": measurement.name,
+        "calls": measurement.calls,
+        "wall_time": measurement.wall_time,
+        "peak_memory": measurement.peak_memory,
+    }
@@ -1,25 +1,36 @@
 from __future__ import annotations
 
 import itertools
+import numpy as np
 import pandas as pd
-import patsy
 
 from bokeh.plotting import figure
 from bokeh.layouts import Column, gridplot, row
-from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional, Tuple, TypeVar, Type
+from bokeh.models import Slider
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Type
 
 from ptplot.animation import Animation
 from ptplot.core import _Aesthetics
 from ptplot.facet import Facet
+from ptplot.grouping import _frame_order, _group_codes, _order_by_groups
+from ptplot.mapping import _copy_on_write_enabled, _evaluate_mapping, _read_only
+from ptplot.profile import _measure_draw, _measure_layer, _measure_phase, profiling
 
 
 if TYPE_CHECKING:
     from bokeh.models import CustomJS
-    from ptplot.core import Layer
+    from ptplot.core import Layer, _Metadata
+    from ptplot.profile import DrawProfile
 
     layer_type = TypeVar("layer_type", bound=Layer)
 
 
+# When frames are decimated but some layers still need to show frames the animation skips, the column of
+# the split up data marking the rows that are in kept frames (see PTPlot._split_facets)
+_KEPT_FRAME = "_ptplot_kept_frame"
+
+
 class PTPlot:
     """The core plotting object, used as the base for all visualizations.
 
@@ -30,13 +41,28 @@ class PTPlot:
     data : The dataset you want to visualize
     pixel_height : How tall the full visualization should be, in pixels. If facets are used this will
     be the total height of all the facets combined.
+    copy_data : If True, the columns used by the visualization are copied out of the dataset before
+    drawing. If False, read-only views of the columns are used instead, which can substantially reduce
+    memory usage for large datasets. ptplot never modifies the dataset either way, but with views
+    any changes you make to the dataset yourself before the visualization is rendered may show up in it.
+    output_backend : How the browser draws the visualization: "canvas" (the default), "svg", or "webgl".
+    WebGL draws markers (including the orientation markers of Positions) on the GPU, which can be much
+    faster for large animations or many facets. Browsers without WebGL fall back to the canvas.
     """
 
-    def __init__(self, data: pd.DataFrame, pixel_height: int = 400):
+    def __init__(
+        self, data: pd.DataFrame, pixel_height: int = 400, copy_data: bool = True, output_backend: str = "canvas"
+    ):
+        if output_backend not in ("canvas", "svg", "webgl"):
+            raise ValueError(f'output_backend must be "canvas", "svg" or "webgl", not "{output_backend}"')
         self.data = data
         self.pixel_height = pixel_height
+        self.copy_data = copy_data
+        self.output_backend = output_backend
 
         self.layers: List[Layer] = []
+        self._draw_state: Optional[_DrawState] = None
+        self.last_profile: Optional[DrawProfile] = None
 
     @property
     def facet_layer(self) -> Facet:
@@ -83,74 +109,246 @@ class PTPlot:
         self.layers.append(layer)
         return self  # Allows method chaining
 
-    def draw(self) -> Column:
+    def draw(self, profile: bool = False) -> Column:
         """
         Build the visualization specified by all the added layers.
 
+        If the plot has already been drawn and the only change since then is that more (non-Facet,
+        non-Animation, non-Aesthetics) layers have been added, only those new layers are drawn,
+        directly into the previously built visualization. Otherwise (including when no layers have
+        been added, e.g. to pick up edits made to the data) the whole visualization is drawn again.
+
+        Parameters
+        ----------
+        profile : If True, record the time and peak memory taken by each phase of drawing and by
+            each layer, and store the report in the last_profile attribute. To forward the
+            report somewhere else or to profile several draws at once, use ptplot.profile.profiling.
+
         Returns
         -------
         The final visualization, which is a Bokeh object that can be rendered
         via any of the common Bokeh methods (e.g. show())
         """
+        if profile:
+            with profiling() as report:
+                plot_grid = self.draw()
+            self.last_profile = report
+            return plot_grid
+
+        with _measure_draw():
+            state = self._draw_state
+            if state is not None and self._can_draw_incrementally(state):
+                self._draw_new_layers(state)
+            else:
+                state = self._draw_all_layers()
+                self._draw_state = state
+        return state.plot_grid
+
+    def _compute_mapping_data(self, mappings: Iterable[str]) -> pd.DataFrame:
+        # make a dataframe where each mapping is a new column, named based on the mapping. Every column is
+        # already either a private copy or a read-only view, so there's no need to copy them again here.
+        return pd.DataFrame(
+            {mapping: _apply_mapping(self.data, mapping, copy=self.copy_data) for mapping in mappings},
+            copy=False,
+        )
+
+    def _row_order(self, mapping_data: pd.DataFrame) -> Optional[np.ndarray[Any, Any]]:
+        """The positions that put the data in the order it's drawn in, or None if it's already in order.
+
+        Rows are grouped by facet and then by aesthetic (so every subset a layer draws is a contiguous
+        block), and if animating are in frame order within each group.
+        """
+        facet_layer = self._get_class_instance_from_layers(Facet)
+        aesthetics_layer = self.aesthetics_layer
+        animation_layer = self.animation_layer
+        frame_mapping = animation_layer.frame_mapping if animation_layer is not None else None
+        frame_order = _frame_order(mapping_data, frame_mapping) if frame_mapping is not None else None
+        positions = frame_order if frame_order is not None else np.arange(len(mapping_data))
+        group_codes = []
+        if facet_layer is not None:
+            group_codes.append(_group_codes(mapping_data, facet_layer.facet_mapping, positions, sort=False))
+        group_codes += aesthetics_layer.group_codes(mapping_data, positions)
+        return _order_by_groups(group_codes, positions)
+
+    def _split_facets(self, mapping_data: pd.DataFrame) -> List[pd.DataFrame]:
+        # Reorder the data once up front so that each facet (and each aesthetic group within it) can
+        # be sliced out without copying, and so animations see the data sorted by the frame column
+        row_order = self._row_order(mapping_data)
+        # Frames decimated away by the animation are dropped in the same step, before any layer
+        # builds its sources from them
+        animation_layer = self.animation_layer
+        is_kept = animation_layer.decimate(mapping_data) if animation_layer is not None else None
+        frame_filters = [layer.get_frame_filter() for layer in self.layers if layer.get_frame_filter() is not None]
+        is_shown = is_kept
+        if is_kept is not None and len(frame_filters) > 0:
+            # Layers that only show some frames still need them, even if the animation skips over them, so
+            # those rows are kept too and only dropped (by _layer_data) for the other layers
+            is_shown = is_kept.copy()
+            for frame_filter in frame_filters:
+                is_shown |= mapping_data[frame_filter].to_numpy(dtype=bool)
+        if is_shown is not None:
+            row_order = np.flatnonzero(is_shown) if row_order is None else row_order[is_shown[row_order]]
+        if row_order is not None:
+            mapping_data = mapping_data.take(row_order)
+            if is_kept is not None and is_shown is not is_kept:
+                mapping_data[_KEPT_FRAME] = is_kept[row_order]
+
+        return [facet_data for (facet_name, facet_data) in self.facet_layer.faceting(mapping_data)]
+
+    def _draw_layers(
+        self, layers: Sequence[Layer], facet_subsets: List[Tuple[pd.DataFrame, _Metadata]], figure_object: figure
+    ) -> List[Callable[[str, Any], CustomJS]]:
+        animations: List[Callable[[str, Any], CustomJS]] = []
+        for data_subset, metadata in facet_subsets:
+            all_frames, kept_frames = _layer_data(data_subset)
+            for layer in layers:
+                layer_data = all_frames if layer.get_frame_filter() is not None else kept_frames
+                with _measure_layer(layer):
+                    layer_animation = layer.draw(self, layer_data, figure_object, metadata)
+                if layer_animation is not None:
+                    animations += layer_animation
+        figure_object.legend.click_policy = "mute"
+        return animations
 
+    def _draw_all_layers(self) -> _DrawState:
         # Extract all mappings set by each layer, then prune duplicates
         all_mappings = itertools.chain(*[layer.get_mappings() for layer in self.layers])
         unique_mappings = set(all_mappings)
-        # make a dataframe where each mapping is a new column, named based on the mapping
-        mapping_data = pd.DataFrame({mapping: _apply_mapping(self.data, mapping) for mapping in unique_mappings})
+        with _measure_phase("mappings"):
+            mapping_data = self._compute_mapping_data(unique_mappings)
 
-        # If animation, sort the data by the frame column
-        if self.animation_layer is not None:
-            mapping_data = mapping_data.sort_values(self.animation_layer.frame_mapping)
-
-        facets = self.facet_layer.faceting(mapping_data)
+        with _measure_phase("grouping"):
+            facets = self._split_facets(mapping_data)
+        # self.facet_layer.num_row should always be non-null at this point, but it
+        # appeases mypy
+        num_rows = self.facet_layer.num_row if self.facet_layer.num_row is not None else 1
 
         figures = []
+        facet_subsets = []
         animations: List[Callable[[str, Any], CustomJS]] = []
-        for (facet_name, facet_data) in facets:
-            # self.facet_layer.num_row should always be non-null at this point, but it
-            # appeases mypy
-            num_rows = self.facet_layer.num_row if self.facet_layer.num_row is not None else 1
-
-            figure_object = figure(sizing_mode="scale_both", height=int(self.pixel_height / num_rows))
-            figure_object.x_range.range_padding = figure_object.y_range.range_padding = 0
-            figure_object.x_range.bounds = figure_object.y_range.bounds = "auto"
-            figure_object.xgrid.visible = False
-            figure_object.ygrid.visible = False
-            figure_object.xaxis.visible = False
-            figure_object.yaxis.visible = False
-            for data_subset, metadata in self.aesthetics_layer.map_aesthetics(facet_data):
-                for layer in self.layers:
-                    layer_animation = layer.draw(self, data_subset, figure_object, metadata)
-                    if layer_animation is not None:
-                        animations += layer_animation
-            figure_object.legend.click_policy = "mute"
+        for facet_data in facets:
+            with _measure_phase("grouping"):
+                subsets = list(self.aesthetics_layer.map_aesthetics(facet_data))
+            with _measure_phase("figures"):
+                figure_object = figure(
+                    sizing_mode="scale_both",
+                    height=int(self.pixel_height / num_rows),
+                    output_backend=self.output_backend,
+                )
+                figure_object.x_range.range_padding = figure_object.y_range.range_padding = 0
+                figure_object.x_range.bounds = figure_object.y_range.bounds = "auto"
+                figure_object.xgrid.visible = False
+                figure_object.ygrid.visible = False
+                figure_object.xaxis.visible = False
+                figure_object.yaxis.visible = False
+            with _measure_phase("layers"):
+                animations += self._draw_layers(self.layers, subsets, figure_object)
             figures.append(figure_object)
+            facet_subsets.append(subsets)
 
-        plot_grid = gridplot(figures, ncols=self.facet_layer.num_col)
+        with _measure_phase("layout"):
+            plot_grid = gridplot(figures, ncols=self.facet_layer.num_col)
         # TODO: could this be handled by using bokeh's tagging functionality?
         # Probably could, by storing the closure with the plot
+        slider = None
         if self.animation_layer is not None:
-            widgets = self.animation_layer.animate(mapping_data, animations)
-            plot_grid.children.append(row(widgets))
-        return plot_grid
+            with _measure_phase("animation"):
+                widgets = self.animation_layer.animate(mapping_data, animations)
+                slider = next(widget for widget in widgets if isinstance(widget, Slider))
+                plot_grid.children.append(row(widgets))
+        return _DrawState(
+            data=self.data,
+            pixel_height=self.pixel_height,
+            copy_data=self.copy_data,
+            output_backend=self.output_backend,
+            layers=list(self.layers),
+            mapping_data=mapping_data,
+            facets=facet_subsets,
+            figures=figures,
+            plot_grid=plot_grid,
+            slider=slider,
+        )
+
+    def _can_draw_incrementally(self, state: _DrawState) -> bool:
+        num_drawn_layers = len(state.layers)
+        if (
+            state.data is not self.data
+            or state.pixel_height != self.pixel_height
+            or state.copy_data != self.copy_data
+            or state.output_backend != self.output_backend
+            or len(self.layers) <= num_drawn_layers
+            or any(layer is not drawn_layer for layer, drawn_layer in zip(self.layers, state.layers))
+        ):
+            return False
+        # These layers change how the data is split up or how every other layer is drawn
+        return not any(isinstance(layer, (Facet, Animation, _Aesthetics)) for layer in self.layers[num_drawn_layers:])
+
+    def _draw_new_layers(self, state: _DrawState) -> None:
+        num_drawn_layers = len(state.layers)
+        new_layers = self.layers[num_drawn_layers:]
+        new_mappings = set(itertools.chain(*[layer.get_mappings() for layer in new_layers])).difference(
+            state.mapping_data.columns
+        )
+        facets: Optional[List[pd.DataFrame]] = None
+        if len(new_mappings) > 0 or any(layer.get_frame_filter() is not None for layer in new_layers):
+            if len(new_mappings) > 0:
+                with _measure_phase("mappings"):
+                    state.mapping_data = pd.concat(
+                        [state.mapping_data, self._compute_mapping_data(new_mappings)], axis=1, copy=False
+                    )
+            # Splitting the data is deterministic, so the new subsets line up with the ones that were
+            # already drawn
+            with _measure_phase("grouping"):
+                facets = self._split_facets(state.mapping_data)
+
+        animations: List[Callable[[str, Any], CustomJS]] = []
+        for facet_index, figure_object in enumerate(state.figures):
+            if facets is not None:
+                with _measure_phase("grouping"):
+                    state.facets[facet_index] = list(self.aesthetics_layer.map_aesthetics(facets[facet_index]))
+            with _measure_phase("layers"):
+                animations += self._draw_layers(new_layers, state.facets[facet_index], figure_object)
+
+        animation_layer = self.animation_layer
+        if animation_layer is not None and state.slider is not None:
+            with _measure_phase("animation"):
+                animation_layer.link(state.slider, animations)
+        state.layers = list(self.layers)
 
 
-def _apply_mapping(
-    data: pd.DataFrame,
-    mapping: str,
-) -> pd.Series:
+@dataclass
+class _DrawState:
+    """Everything needed to add more layers to an already drawn visualization."""
+
+    data: pd.DataFrame
+    pixel_height: int
+    copy_data: bool
+    output_backend: str
+    layers: List[Layer]
+    mapping_data: pd.DataFrame
+    facets: List[List[Tuple[pd.DataFrame, _Metadata]]]
+    figures: List[figure]
+    plot_grid: Column
+    slider: Optional[Slider]
+
+
+def _layer_data(data: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Split a subset of the data into the rows for layers that only show some frames (see
+    Layer.get_frame_filter) and the rows for every other layer, which only get the frames the animation
+    keeps."""
+    if _KEPT_FRAME not in data.columns:
+        return data, data
+    all_frames = data.drop(columns=_KEPT_FRAME)
+    return all_frames, all_frames[data[_KEPT_FRAME].to_numpy()]
+
+
+def _apply_mapping(data: pd.DataFrame, mapping: str, copy: bool = True) -> pd.Series:
+    """Compute the data for a mapping. If copy is False, the output may be a read-only view of
+    the input data rather than a copy of it."""
     if mapping in data.columns:
-        return data[mapping].copy(deep=True)
-
-    processed_string_data = patsy.dmatrix(
-        f"I({mapping}) - 1", data, NA_action=patsy.NAAction(NA_types=[]), return_type="dataframe"
-    )
-
-    final_data = (
-        processed_string_data[processed_string_data.columns[0]]
-        if len(processed_string_data.columns) == 1  # pure arithmetic
-        else processed_string_data[processed_string_data.columns[1]].astype(bool)  # conditional
-    )
-    final_data.name = mapping  # Have to explicitly assign the mapping as the name
-    return final_data
+        if _copy_on_write_enabled():
+            # pandas will take care of copying the column if either it or the original data is modified
+            return data[mapping]
+        return data[mapping].copy(deep=True) if copy else _read_only(data[mapping])
+
+    return _evaluate_mapping(data, mapping, copy=copy)
@@ -0,0 +1,195 @@
+"""Tools for generating synthetic data, for testing and benchmarking visualizations at scale."""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from typing import Any, Optional
+
+
+# fmt: off
+TEAMS = (
+    "ARI", "ATL", "BAL", "BUF", "CAR", "CHI", "CIN", "CLE", "DAL", "DEN", "DET", "GB", "HOU", "IND", "JAX", "KC",
+    "LAC", "LAR", "MIA", "MIN", "NE", "NO", "NYG", "NYJ", "OAK", "PHI", "PIT", "SEA", "SF", "TB", "TEN", "WAS",
+)
+# fmt: on
+OFFENSE_POSITIONS = ("QB", "RB", "WR", "WR", "WR", "TE", "T", "G", "C", "G", "T")
+DEFENSE_POSITIONS = ("DE", "DT", "DT", "DE", "OLB", "ILB", "OLB", "CB", "CB", "FS", "SS")
+BALL_NAME = "ball"
+
+_PLAYERS_PER_TEAM = 11
+_NUM_ENTITIES = 2 * _PLAYERS_PER_TEAM + 1  # both teams plus the ball
+_SECONDS_PER_FRAME = 0.1
+_FIELD_LENGTH = 120
+_FIELD_WIDTH = 53.3
+_QB, _RECEIVER = 0, 2  # The offensive players who throw and catch the ball
+
+
+def generate_tracking_data(
+    num_games: int = 1, num_plays: int = 1, num_frames: int = 100, seed: Optional[int] = None
+) -> pd.DataFrame:
+    """Generate synthetic player-tracking data.
+
+    The data uses the same schema (and row order) as the NFL tracking data in the example notebooks:
+    one row for each of the 22 players and the ball in every frame, sampled at 10 Hz, with positions
+    in yards, speeds in yards per second, and angles in degrees. Like the real data, the ball has
+    no team, jersey number or orientation. Every play is a pass from the quarterback to a receiver,
+    with the corresponding events marked. The movement isn't realistic football, just smooth enough
+    to look plausible when animated.
+
+    Everything is generated with vectorized operations, so millions of rows take seconds.
+
+    Parameters
+    ----------
+    num_games : The number of games to generate. Each one is between a different pair of teams
+        (cycling through the league once it runs out of teams).
+    num_plays : The number of plays in each game.
+    num_frames : The number of frames in each play.
+    seed : The seed for the random number generator. Calls with the same seed and arguments
+        return identical data.
+
+    Returns
+    -------
+    The tracking data, with columns gameId, playId, playDirection, homeTeamFlag, teamAbbr, frame,
+    displayName, jerseyNumber, nflId, position, time, x, y, s, o, dir and event.
+    """
+    if num_games < 1 or num_plays < 1 or num_frames < 1:
+        raise ValueError("num_games, num_plays and num_frames must all be positive")
+    rng = np.random.default_rng(seed)
+    total_plays = num_games * num_plays
+    game_index = np.repeat(np.arange(num_games), num_plays)
+
+    # Teams, ordered as (home, away) for each game
+    team_indices = np.concatenate([rng.permutation(len(TEAMS)) for _ in range(-(-2 * num_games // len(TEAMS)))])
+    game_teams = team_indices[: 2 * num_games].reshape(num_games, 2)
+    home_on_offense = rng.random(total_plays) < 0.5
+    # For every play, whether each entity is on the home team (players on offense come first)
+    is_home = np.empty((total_plays, _NUM_ENTITIES))
+    is_home[:, :_PLAYERS_PER_TEAM] = home_on_offense[:, None]
+    is_home[:, _PLAYERS_PER_TEAM:-1] = ~home_on_offense[:, None]
+    is_home[:, -1] = np.nan
+    team_slot = np.where(np.isnan(is_home), 0, 1 - np.nan_to_num(is_home)).astype(int)
+    team_abbr = np.array(TEAMS, dtype=object)[game_teams[game_index[:, None], team_slot]]
+    team_abbr[:, -1] = np.nan
+
+    # Each team has its own jersey numbers and player ids for every game
+    jerseys = np.argsort(rng.random((num_games, 2, 99)), axis=2)[:, :, :_PLAYERS_PER_TEAM] + 1.0
+    player_slot = np.tile(np.arange(_NUM_ENTITIES) % _PLAYERS_PER_TEAM, (total_plays, 1))
+    jersey_number = jerseys[game_index[:, None], team_slot, player_slot]
+    player_number = (game_index[:, None] * 2 + team_slot) * _PLAYERS_PER_TEAM + player_slot
+    nfl_id = 1_000_000.0 + player_number
+    names = np.array([f"Player {number}" for number in range(2 * num_games * _PLAYERS_PER_TEAM)], dtype=object)
+    display_name = names[player_number]
+    jersey_number[:, -1] = nfl_id[:, -1] = np.nan
+    display_name[:, -1] = BALL_NAME
+    position = np.tile(np.array(OFFENSE_POSITIONS + DEFENSE_POSITIONS + (np.nan,), dtype=object), (total_plays, 1))
+
+    # Key moments of each play, as frame numbers
+    snap = (num_frames * rng.uniform(0.1, 0.3, total_plays)).astype(int)
+    pass_forward = snap + (num_frames * rng.uniform(0.1, 0.2, total_plays)).astype(int)
+    pass_arrived = pass_forward + (num_frames * rng.uniform(0.05, 0.1, total_plays)).astype(int) + 1
+    tackle = np.minimum(pass_arrived + (num_frames * rng.uniform(0.1, 0.3, total_plays)).astype(int), num_frames - 1)
+    frames = np.arange(num_frames)
+
+    # Player movement: players start in formation around the line of scrimmage, then after the snap
+    # run with a smoothly varying speed and heading.
+    direction = np.where(rng.random(total_plays) < 0.5, 1.0, -1.0)  # +1 if the offense is going right
+    line_of_scrimmage = rng.uniform(20, _FIELD_LENGTH - 20, total_plays)
+    depth = np.concatenate(
+        [-rng.uniform(0.5, 8, (total_plays, _PLAYERS_PER_TEAM)), rng.uniform(1, 12, (total_plays, _PLAYERS_PER_TEAM))],
+        axis=1,
+    )
+    depth[:, _QB] = -rng.uniform(0.5, 1.5, total_plays)  # Under center, so the snap doesn't teleport the ball
+    start_x = line_of_scrimmage[:, None] + direction[:, None] * depth
+    start_y = rng.uniform(8, _FIELD_WIDTH - 8, (total_plays, 2 * _PLAYERS_PER_TEAM))
+    heading = rng.uniform(0, 2 * np.pi, (total_plays, 2 * _PLAYERS_PER_TEAM, 1)) + np.cumsum(
+        rng.normal(0, 0.05, (total_plays, 2 * _PLAYERS_PER_TEAM, num_frames)), axis=2
+    )
+    top_speed = rng.uniform(2, 9, (total_plays, 2 * _PLAYERS_PER_TEAM, 1))
+    seconds_since_snap = np.clip(frames[None, :] - snap[:, None], 0, None)[:, None, :] * _SECONDS_PER_FRAME
+    speed = top_speed * (1 - np.exp(-seconds_since_snap)) + np.abs(
+        rng.normal(0, 0.1, (total_plays, 2 * _PLAYERS_PER_TEAM, num_frames))
+    )
+    x = start_x[:, :, None] + np.cumsum(speed * np.cos(heading) * _SECONDS_PER_FRAME, axis=2)
+    y = start_y[:, :, None] + np.cumsum(speed * np.sin(heading) * _SECONDS_PER_FRAME, axis=2)
+    x = np.clip(x, -5, _FIELD_LENGTH + 5)
+    y = np.clip(y, -5, _FIELD_WIDTH + 5)
+
+    # The ball starts on the line of scrimmage, goes to the quarterback on the snap, then gets
+    # thrown to the receiver. (For very short plays some of this happens after the last frame.)
+    play_index = np.arange(total_plays)
+    throw_frame = np.minimum(pass_forward, num_frames - 1)
+    catch_frame = np.minimum(pass_arrived, num_frames - 1)
+    throw_x, throw_y = x[play_index, _QB, throw_frame][:, None], y[play_index, _QB, throw_frame][:, None]
+    catch_x, catch_y = x[play_index, _RECEIVER, catch_frame][:, None], y[play_index, _RECEIVER, catch_frame][:, None]
+    flight = (frames[None, :] - pass_forward[:, None]) / (pass_arrived - pass_forward)[:, None]
+    in_flight = (flight >= 0) & (flight < 1)
+    caught = flight >= 1
+    before_snap = frames[None, :] < snap[:, None]
+    ball_x = np.where(in_flight, throw_x + flight * (catch_x - throw_x), x[:, _QB, :])
+    ball_y = np.where(in_flight, throw_y + flight * (catch_y - throw_y), y[:, _QB, :])
+    ball_x = np.where(caught, x[:, _RECEIVER, :], ball_x)
+    ball_y = np.where(caught, y[:, _RECEIVER, :], ball_y)
+    ball_x = np.where(before_snap, line_of_scrimmage[:, None], ball_x)
+    ball_y = np.where(before_snap, _FIELD_WIDTH / 2, ball_y)
+    x = np.concatenate([x, ball_x[:, None, :]], axis=1)
+    y = np.concatenate([y, ball_y[:, None, :]], axis=1)
+
+    # Angles follow the NFL convention: 0 degrees points along +y, increasing clockwise
+    dir_ = np.concatenate(
+        [np.mod(90 - np.degrees(heading), 360), np.full((total_plays, 1, num_frames), np.nan)], axis=1
+    )
+    orientation = np.mod(dir_ + rng.normal(0, 20, dir_.shape), 360)
+    ball_speed = np.hypot(
+        np.diff(ball_x, axis=1, prepend=ball_x[:, :1]), np.diff(ball_y, axis=1, prepend=ball_y[:, :1])
+    )
+    speed = np.concatenate([speed, ball_speed[:, None, :] / _SECONDS_PER_FRAME], axis=1)
+
+    event = np.full((total_plays, num_frames), np.nan, dtype=object)
+    for event_frames, event_name in [
+        (snap, "ball_snap"),
+        (pass_forward, "pass_forward"),
+        (pass_arrived, "pass_arrived"),
+        (tackle, "tackle"),
+    ]:
+        in_play = event_frames < num_frames
+        event[play_index[in_play], event_frames[in_play]] = event_name
+
+    play_id = np.tile(np.arange(num_plays) * 25 + 50, num_games)
+    start_time = (
+        np.datetime64("2018-09-09T17:00:00")
+        + np.timedelta64(7, "D") * game_index
+        + np.timedelta64(40, "s") * np.tile(np.arange(num_plays), num_games)
+    ).astype("datetime64[ms]")
+    time = start_time[:, None] + frames[None, :] * np.timedelta64(int(_SECONDS_PER_FRAME * 1000), "ms")
+
+    def per_entity(values: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+        return np.repeat(values.ravel(), num_frames)
+
+    def per_play(values: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+        return np.repeat(values, _NUM_ENTITIES * num_frames)
+
+    def per_frame(values: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+        return np.broadcast_to(values[:, None, :], (total_plays, _NUM_ENTITIES, num_frames)).ravel()
+
+    return pd.DataFrame(
+        {
+            "gameId": per_play(2018090900 + game_index),
+            "playId": per_play(play_id),
+            "playDirection": per_play(np.where(direction > 0, "right", "left").astype(object)),
+            "homeTeamFlag": per_entity(is_home),
+            "teamAbbr": per_entity(team_abbr),
+            "frame": np.tile(frames, total_plays * _NUM_ENTITIES),
+            "displayName": per_entity(display_name),
+            "jerseyNumber": per_entity(jersey_number),
+            "nflId": per_entity(nfl_id),
+            "position": per_entity(position),
+            "time": per_frame(time),
+            "x": x.ravel(),
+            "y": y.ravel(),
+            "s": speed.ravel(),
+            "o": orientation.ravel(),
+            "dir": dir_.ravel(),
+            "event": per_frame(event),
+        }
+    )
@@ -11,8 +11,9 @@ with open('README.md') as readme_file:
 
 extras = {
     'dev': [
-        'black','notebook', 'flake8', 'mypy', 'pytest', 'pytest-cov', 'tox'
+        'black','notebook', 'flake8', 'mypy', 'pytest', 'pytest-benchmark', 'pytest-cov', 'tox'
     ],
+    'performance': ['numexpr'],
     'no_pip_package': ['nodejs', 'pip']
 }
 
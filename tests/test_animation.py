@@ -0,0 +1,190 @@
+import pandas as pd
+import pytest
+
+import ptplot.ptplot as pt
+from bokeh.models import CustomJS, Slider, Toggle
+from ptplot import animation
+from ptplot.animation import Animation
+from ptplot.nfl import Field
+from ptplot.plot import Positions, Tracks
+
+
+class TestAnimation:
+    def test_rejects_unknown_mode(self):
+        with pytest.raises(ValueError):
+            Animation("frame", 10, mode="other")
+
+    def test_rejects_non_positive_speed(self):
+        with pytest.raises(ValueError):
+            Animation("frame", 10, speed=0)
+
+    def test_play_button_passes_playback_rate(self):
+        data = pd.DataFrame({"x": [1.0, 2.0], "y": [1.0, 2.0], "frame": [1, 2]})
+        grid = (pt.PTPlot(data) + Field() + Positions("x", "y") + Animation("frame", 10, speed=2)).draw()
+        toggle = next(model for model in grid.references() if isinstance(model, Toggle))
+        (callback,) = toggle.js_property_callbacks["change:active"]
+        assert callback.args["frame_rate"] == 10
+        assert callback.args["speed"] == 2
+        assert "requestAnimationFrame" in callback.code
+
+    def test_attaches_single_callback_to_slider(self):
+        data = pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0], "y": [1.0, 2.0, 3.0, 4.0], "frame": [1, 2, 1, 2], "p": list("aabb")})
+        grid = (pt.PTPlot(data) + Field() + Tracks("x", "y", "p") + Positions("x", "y") + Animation("frame", 10)).draw()
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        (callback,) = slider.js_property_callbacks["change:value"]
+        # One group for the tracks and one for the positions
+        assert len(callback.args["animations_0"]) == 1
+        assert len(callback.args["animations_1"]) == 1
+        assert "animations_2" not in callback.args
+
+
+class TestScrubbing:
+    data = pd.DataFrame({"x": [1.0, 2.0], "y": [1.0, 2.0], "frame": [1, 2]})
+
+    def test_updates_while_dragging_by_default(self):
+        grid = (pt.PTPlot(self.data) + Field() + Positions("x", "y") + Animation("frame", 10)).draw()
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        assert list(slider.js_property_callbacks) == ["change:value"]
+
+    def test_can_update_only_on_release(self):
+        animation = Animation("frame", 10, live_scrubbing=False)
+        grid = (pt.PTPlot(self.data) + Field() + Positions("x", "y") + animation).draw()
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        assert list(slider.js_property_callbacks) == ["change:value_throttled"]
+
+    def test_frame_cache_budget(self):
+        grid = (pt.PTPlot(self.data) + Field() + Positions("x", "y") + Animation("frame", 10, frame_cache_mb=2)).draw()
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        (callback,) = slider.js_property_callbacks["change:value"]
+        assert callback.args["cache_bytes"] == 2 * 2**20
+        with pytest.raises(ValueError):
+            Animation("frame", 10, frame_cache_mb=-1)
+
+    def test_merged_callbacks_are_distinguishable(self):
+        first, second = (animation._merge_callbacks([CustomJS(code="")], 0) for _ in range(2))
+        assert first.args["callback_id"] != second.args["callback_id"]
+
+
+class TestDecimation:
+    data = pd.DataFrame(
+        {
+            "frame": [3, 1, 2, 4, 5, 6, 7, 1],
+            "time": pd.Timestamp("2020-01-01") + pd.to_timedelta([0.3, 0, 0.2, 0.4, 0.5, 1.1, 1.2, 0], unit="s"),
+            "event": [None, None, None, "snap", None, None, None, None],
+        }
+    )
+
+    def test_rejects_multiple_policies(self):
+        with pytest.raises(ValueError):
+            Animation("frame", 10, keep_every=2, target_frame_rate=5)
+
+    def test_interpolation_requires_entity_mapping(self):
+        with pytest.raises(ValueError):
+            Animation("frame", 10, interpolate=True)
+
+    def test_time_resolution_requires_time_mapping(self):
+        with pytest.raises(ValueError):
+            Animation("frame", 10, time_resolution=0.5)
+
+    def test_keeps_every_frame_by_default(self):
+        assert Animation("frame", 10).kept_frames(self.data) is None
+        assert Animation("frame", 10).decimate(self.data) is None
+
+    def test_keep_every(self):
+        assert Animation("frame", 10, keep_every=3).kept_frames(self.data).tolist() == [1, 4, 7]
+
+    def test_target_frame_rate(self):
+        assert Animation("frame", 10, target_frame_rate=5).kept_frames(self.data).tolist() == [1, 3, 5, 7]
+
+    def test_time_resolution(self):
+        animation = Animation("frame", 10, time_mapping="time", time_resolution=0.25)
+        assert animation.kept_frames(self.data).tolist() == [1, 3, 5, 6]
+
+    def test_keeps_event_frames(self):
+        animation = Animation("frame", 10, keep_every=3, event_mapping="event")
+        assert animation.kept_frames(self.data).tolist() == [1, 4, 7]
+        animation = Animation("frame", 10, keep_every=2, event_mapping="event")
+        assert animation.kept_frames(self.data).tolist() == [1, 3, 4, 5, 7]
+
+    def test_decimate(self):
+        assert Animation("frame", 10, keep_every=3).decimate(self.data).tolist() == [
+            False, True, False, True, False, False, True, True
+        ]
+
+    def test_evenly_spaced_frames_step_the_slider(self):
+        slider = Animation("frame", 10, keep_every=3).animate(self.data, [])[1]
+        assert (slider.start, slider.end, slider.step) == (1, 7, 3)
+
+    def test_unevenly_spaced_frames_show_latest_kept_frame(self):
+        animation = Animation("frame", 10, keep_every=3, event_mapping="event")
+        data = self.data.assign(event=[None, None, "snap", None, None, None, None, None])
+        play_pause, slider = animation.animate(data, [])
+        assert (slider.start, slider.end, slider.step) == (1, 7, 1)
+        (playback,) = play_pause.js_property_callbacks["change:active"]
+        assert playback.args["frame_lookup"] == [0, 1, 1, 3, 3, 3, 6]
+
+    def test_draws_only_kept_frames(self):
+        data = pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0], "y": [1.0, 2.0, 3.0, 4.0], "frame": [1, 2, 3, 4]})
+        plot = pt.PTPlot(data) + Field() + Positions("x", "y") + Animation("frame", 10, keep_every=2)
+        grid = plot.draw()
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        (callback,) = slider.js_property_callbacks["change:value"]
+        (positions,) = callback.args["animations_0"]
+        assert positions["full_source"].data["frame"].tolist() == [1, 3]
+
+    def test_keeps_frames_shown_by_frame_filter(self):
+        data = pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0], "y": [1.0, 2.0, 3.0, 4.0], "frame": [1, 2, 3, 4]})
+        plot = (
+            pt.PTPlot(data)
+            + Field()
+            + Positions("x", "y", frame_filter="frame == 2", name="snap")
+            + Animation("frame", 10, keep_every=2)
+        )
+        grid = plot.draw()
+        (snap,) = [model for model in grid.references() if getattr(model, "name", None) == "snap"]
+        assert snap.data_source.data["frame"].tolist() == [2]
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        assert (slider.start, slider.end, slider.step) == (1, 3, 2)
+
+    def test_only_layers_with_frame_filter_get_skipped_frames(self):
+        data = pd.DataFrame({
+            "x": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "y": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "frame": [1, 2, 3, 4, 5],
+            "player": [1, 1, 1, 1, 1],
+        })
+        plot = (
+            pt.PTPlot(data)
+            + Field()
+            + Tracks("x", "y", "player")
+            + Positions("x", "y", frame_filter="frame == 2", name="snap")
+            + Positions("x", "y")
+            + Animation("frame", 10, keep_every=2)
+        )
+        grid = plot.draw()
+        (snap,) = [model for model in grid.references() if getattr(model, "name", None) == "snap"]
+        assert snap.data_source.data["frame"].tolist() == [2]
+        assert "_ptplot_kept_frame" not in snap.data_source.data
+        slider = next(model for model in grid.references() if isinstance(model, Slider))
+        (callback,) = slider.js_property_callbacks["change:value"]
+        animations = [callback.args[name] for name in callback.args if name.startswith("animations_")]
+        frame_stores = {id(args["full_source"]): args["full_source"] for group in animations for args in group}
+        assert len(frame_stores) == 1
+        assert [store.data["frame"].tolist() for store in frame_stores.values()] == [[1, 3, 5]]
+
+
+class TestInternalMergeCallbacks:
+    def test_groups_callbacks_by_code_and_arguments(self):
+        callbacks = [
+            CustomJS(args={"a": 1}, code="first"),
+            CustomJS(args={"a": 2}, code="first"),
+            CustomJS(args={"a": 3, "b": 4}, code="first"),
+            CustomJS(args={"a": 5}, code="second"),
+        ]
+        merged = animation._merge_callbacks(callbacks, 0)
+        assert merged.args["initial_frame"] == 0
+        assert merged.args["animations_0"] == [{"a": 1}, {"a": 2}]
+        assert merged.args["animations_1"] == [{"a": 3, "b": 4}]
+        assert merged.args["animations_2"] == [{"a": 5}]
+        assert "function update_1({a, b}) {first}" in merged.code
+        assert merged.code.count("second") == 1
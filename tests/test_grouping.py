@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ptplot import grouping
+
+
+class TestInternalFrameOrder:
+    def test_skips_sort_when_already_ordered(self):
+        data = pd.DataFrame({"frame": [1, 1, 2, 3, 3]})
+        assert grouping._frame_order(data, "frame") is None
+
+    def test_sort_is_stable(self):
+        data = pd.DataFrame({"frame": [2, 1, 2, 1, 3], "player": ["a", "a", "b", "b", "c"]})
+        np.testing.assert_array_equal(grouping._frame_order(data, "frame"), [1, 3, 0, 2, 4])
+
+
+class TestInternalOrderByGroups:
+    def test_orders_by_each_level_in_turn(self):
+        data = pd.DataFrame({"team": ["B", "A", "B", "A", "B", "A"], "is_home": [True, False, False, True, True, False]})
+        positions = np.arange(len(data))
+        codes = [grouping._group_codes(data, "team", positions), grouping._group_codes(data, "is_home", positions)]
+        np.testing.assert_array_equal(grouping._order_by_groups(codes, positions), [1, 5, 3, 2, 0, 4])
+
+    def test_keeps_base_order_within_groups(self):
+        data = pd.DataFrame({"team": ["A", "B", "A", "B"]})
+        positions = np.array([3, 2, 1, 0])
+        codes = [grouping._group_codes(data, "team", positions)]
+        np.testing.assert_array_equal(grouping._order_by_groups(codes, positions), [2, 0, 3, 1])
+
+    def test_returns_none_when_already_ordered(self):
+        data = pd.DataFrame({"team": ["A", "A", "B"]})
+        positions = np.arange(len(data))
+        assert grouping._order_by_groups([grouping._group_codes(data, "team", positions)], positions) is None
+
+
+class TestInternalGroupBy:
+    @pytest.mark.parametrize("sort", [True, False])
+    @pytest.mark.parametrize("keys", [
+        ["b", "b", "a", "a", "c"],
+        ["b", "a", "b", "c", "a"],
+        ["b", None, "a", "b", None],
+        [True, False, True, True, False],
+        [2.0, np.nan, 1.0, 2.0, 1.0],
+    ])
+    def test_matches_groupby(self, keys, sort):
+        data = pd.DataFrame({"key": keys, "value": range(len(keys))})
+        expected = list(data.groupby("key", sort=sort))
+        actual = list(grouping._group_by(data, "key", sort=sort))
+        assert [name for name, _ in actual] == [name for name, _ in expected]
+        assert [type(name) for name, _ in actual] == [type(name) for name, _ in expected]
+        for (_, actual_data), (_, expected_data) in zip(actual, expected):
+            pd.testing.assert_frame_equal(actual_data, expected_data)
+
+    def test_contiguous_groups_are_not_copied(self):
+        data = pd.DataFrame({"key": ["a", "a", "b"], "value": [1.0, 2.0, 3.0]})
+        groups = dict(grouping._group_by(data, "key"))
+        assert np.shares_memory(groups["b"]["value"].to_numpy(), data["value"].to_numpy())
+
+    def test_empty_data(self):
+        assert list(grouping._group_by(pd.DataFrame({"key": []}), "key")) == []
+
+
+class TestInternalGroupPositions:
+    def test_matches_groupby_indices(self):
+        data = pd.DataFrame({"key": ["b", "a", None, "b", "c", "a"]})
+        positions = {name: rows.tolist() for name, rows in grouping._group_positions(data, "key")}
+        assert positions == {"a": [1, 5], "b": [0, 3], "c": [4]}
+        assert list(positions) == ["a", "b", "c"]
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import patsy
+import pytest
+
+from ptplot import mapping
+
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_caches():
+    mapping._clear_mapping_caches()
+    yield
+    mapping._clear_mapping_caches()
+
+
+class TestInternalLRUCache:
+    def test_evicts_least_recently_used(self):
+        cache = mapping._LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_missing_key_returns_none(self):
+        cache = mapping._LRUCache(2)
+        assert cache.get("missing") is None
+
+
+class TestInternalEvaluateMapping:
+    @pytest.fixture(scope="function")
+    def input_data(self):
+        df = pd.DataFrame({
+            "a": [1, 2, 3, 4, 5],
+            "b": [6, 7, 8, 9, 10]
+        })
+        return df
+
+    def test_compiles_once_per_schema(self, input_data):
+        mapping._evaluate_mapping(input_data, "a * b")
+        compiled = mapping._COMPILED_MAPPINGS.get(("a * b", mapping._schema(input_data)))
+        other_data = input_data + 1
+        actual = mapping._evaluate_mapping(other_data, "a * b")
+        assert mapping._COMPILED_MAPPINGS.get(("a * b", mapping._schema(other_data))) is compiled
+        pd.testing.assert_series_equal(actual, pd.Series([14., 24., 36., 50., 66.], name="a * b"))
+
+    def test_recompiles_when_schema_changes(self, input_data):
+        mapping._evaluate_mapping(input_data, "a * b")
+        float_data = input_data.astype(float)
+        actual = mapping._evaluate_mapping(float_data, "a * b")
+        assert len(mapping._COMPILED_MAPPINGS) == 2
+        pd.testing.assert_series_equal(actual, pd.Series([6., 14., 24., 36., 50.], name="a * b"))
+
+    def test_recomputes_after_in_place_edit(self, input_data):
+        mapping._evaluate_mapping(input_data, "a * b")
+        input_data.loc[0, "a"] = 100
+        actual = mapping._evaluate_mapping(input_data, "a * b")
+        pd.testing.assert_series_equal(actual, pd.Series([600., 14., 24., 36., 50.], name="a * b"))
+
+    def test_recomputes_when_column_replaced(self, input_data):
+        mapping._evaluate_mapping(input_data, "a + b")
+        input_data["b"] = [0, 0, 0, 0, 0]
+        actual = mapping._evaluate_mapping(input_data, "a + b")
+        pd.testing.assert_series_equal(actual, pd.Series([1., 2., 3., 4., 5.], name="a + b"))
+
+    def test_does_not_copy_computed_results(self, input_data, monkeypatch):
+        def copy(self, deep=True):
+            raise AssertionError("copied a computed result")
+
+        monkeypatch.setattr(pd.Series, "copy", copy)
+        actual = mapping._evaluate_mapping(input_data, "a * b")
+        pd.testing.assert_series_equal(actual, pd.Series([6., 14., 24., 36., 50.], name="a * b"))
+
+    @pytest.mark.parametrize("copy", [True, False])
+    def test_result_never_writes_back_to_data(self, copy):
+        data = pd.DataFrame({"flag": [True, False, True]})
+        actual = mapping._evaluate_mapping(data, "Q('flag')", copy=copy)
+        if copy:
+            actual[0] = False
+        else:
+            with pytest.raises(ValueError, match="read-only"):
+                actual[0] = False
+        assert data["flag"].tolist() == [True, False, True]
+
+
+class TestInternalNumpyMapping:
+    @pytest.fixture(scope="function")
+    def input_data(self):
+        df = pd.DataFrame({
+            "a": [1, 2, 3, 4, 5],
+            "b": [6., 7., 8., 9., 10.],
+            "team": ["A", "B", "A", None, "B"],
+            "one + two": [1, 1, 1, 1, 1],
+        })
+        return df
+
+    @pytest.mark.parametrize("expression", [
+        "a * b", "3*a > b", "-a + 2 ** a", "(a > 2) & (b < 10)", "team == 'A'", "'B' != team", "Q('one + two') / 2"
+    ])
+    def test_uses_native_engine_and_matches_patsy(self, input_data, expression):
+        compiled, _ = mapping._compile_mapping(expression, input_data)
+        assert isinstance(compiled, mapping._NumpyMapping)
+        _, expected = mapping._PatsyMapping.compile(expression, input_data)
+        pd.testing.assert_series_equal(compiled.evaluate(input_data), expected)
+
+    @pytest.mark.parametrize("expression", ["abs(a)", "a % 2", "a // 2", "1 < a < 3", "team > 'A'", "a + 1 and b"])
+    def test_falls_back_to_patsy_for_unsupported_expressions(self, input_data, expression):
+        with pytest.raises(mapping._UnsupportedExpression):
+            mapping._NumpyMapping.compile(expression, input_data)
+
+    def test_evaluates_with_numexpr(self, input_data, monkeypatch):
+        pytest.importorskip("numexpr")
+        monkeypatch.setattr(mapping, "_NUMEXPR_MIN_ROWS", 0)
+        compiled = mapping._NumpyMapping.compile("a / 2 + b", input_data)
+        assert compiled.node.numexpr is not None
+        expected = pd.Series([6.5, 8., 9.5, 11., 12.5], name="a / 2 + b")
+        pd.testing.assert_series_equal(compiled.evaluate(input_data), expected)
+
+    def test_errors_match_patsy(self, input_data):
+        with pytest.raises(patsy.PatsyError):
+            mapping._evaluate_mapping(input_data, "a ** -1")
+
+
+class TestInternalNumpyMappingLargeData:
+    # Large enough for numexpr to be used, if it's installed
+    @pytest.fixture(scope="function")
+    def input_data(self):
+        num_rows = mapping._NUMEXPR_MIN_ROWS
+        return pd.DataFrame({
+            "i": np.tile([-2, -1, 0, 1], num_rows // 4),
+            "j": np.tile([0, 1, 2, 3], num_rows // 4),
+            "u": np.tile(np.array([0, 5, 200, 255], dtype=np.uint8), num_rows // 4),
+            "x": np.tile([0.5, 1.5, 2.5, 3.5], num_rows // 4),
+        })
+
+    @pytest.mark.parametrize("expression", ["j ** i", "2 ** i"])
+    def test_negative_integer_powers_error_like_patsy(self, input_data, expression):
+        with pytest.raises(patsy.PatsyError):
+            mapping._evaluate_mapping(input_data, expression)
+
+    @pytest.mark.parametrize("expression", ["u - 10", "i * j + 3", "x / 2 + j", "x ** 2 > j"])
+    def test_matches_patsy(self, input_data, expression):
+        _, expected = mapping._PatsyMapping.compile(expression, input_data)
+        pd.testing.assert_series_equal(mapping._evaluate_mapping(input_data, expression), expected)
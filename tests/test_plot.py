@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ptplot.ptplot as pt
+from ptplot import plot
+from ptplot.animation import Animation
+from ptplot.hover import Hover
+
+
+class TestInternalFrameOffsets:
+    def test_finds_start_and_end_of_each_frame(self):
+        offsets = plot._frame_offsets(np.array([3, 3, 4, 6, 6, 6, 7]), 2)
+        np.testing.assert_array_equal(offsets.data["start"], [0, 0, 2, 3, 3, 6])
+        np.testing.assert_array_equal(offsets.data["end"], [0, 2, 3, 3, 6, 7])
+
+    def test_can_leave_out_starts(self):
+        offsets = plot._frame_offsets(np.array([1, 2, 2]), 1, include_starts=False)
+        assert list(offsets.data) == ["end"]
+        np.testing.assert_array_equal(offsets.data["end"], [1, 3])
+
+    def test_no_frames(self):
+        offsets = plot._frame_offsets(np.array([]), 1)
+        assert len(offsets.data["start"]) == len(offsets.data["end"]) == 0
+
+
+class TestInternalNextRows:
+    def test_finds_each_entitys_next_row(self):
+        np.testing.assert_array_equal(plot._next_rows(["a", "b", "a", "c", "b"]), [2, 4, -1, -1, -1])
+
+    def test_no_rows(self):
+        assert len(plot._next_rows([])) == 0
+
+
+class TestInternalTrackFrameOffsets:
+    def test_finds_end_of_each_frame_in_each_track(self):
+        offsets = plot._track_frame_offsets([np.array([1, 2, 3]), np.array([2, 3])], 1)
+        np.testing.assert_array_equal(offsets.data["end"], [1, 0, 2, 1, 3, 2])
+
+    def test_no_frames(self):
+        assert len(plot._track_frame_offsets([], 1).data["end"]) == 0
+
+
+class TestTracks:
+    def test_draws_one_glyph_per_group(self):
+        data = pd.DataFrame(
+            {"x": [1.0, 2.0, 3.0, 4.0, 5.0], "y": [5.0, 6.0, 7.0, 8.0, 9.0], "frame": [1, 1, 2, 2, 3], "p": list("ababa")}
+        )
+        grid = (pt.PTPlot(data) + plot.Tracks("x", "y", "p", name="tracks") + Animation("frame", 10)).draw()
+        (renderer,) = [
+            renderer for renderer in grid.children[1].children[0][0].renderers if renderer.name == "tracks"
+        ]
+        assert renderer.data_source.data["p"].tolist() == ["a", "b"]
+        # Only the first frame is shown to begin with
+        assert [track.tolist() for track in renderer.data_source.data["x"]] == [[1.0], [2.0]]
+
+    def test_leaves_out_columns_that_change_within_a_track(self):
+        data = pd.DataFrame(
+            {"x": [1.0, 2.0, 3.0], "y": [5.0, 6.0, 7.0], "p": list("aba"), "team": list("ABA"), "s": [1, 2, 3]}
+        )
+        hover = Hover("@team: @s", "tracks", ["team", "s"])
+        grid = (pt.PTPlot(data) + plot.Tracks("x", "y", "p", name="tracks") + hover).draw()
+        (renderer,) = [
+            renderer for renderer in grid.children[1].children[0][0].renderers if renderer.name == "tracks"
+        ]
+        assert renderer.data_source.data["team"].tolist() == ["A", "B"]
+        # Otherwise hovering over track a would show the speed at its first frame
+        assert "s" not in renderer.data_source.data
+
+    def test_static_tracks_are_complete(self):
+        data = pd.DataFrame({"x": [1.0, 2.0, 3.0], "y": [5.0, 6.0, 7.0], "p": list("aba")})
+        grid = (pt.PTPlot(data) + plot.Tracks("x", "y", "p", name="tracks")).draw()
+        (renderer,) = [renderer for renderer in grid.children[1].children[0][0].renderers if renderer.name == "tracks"]
+        assert [track.tolist() for track in renderer.data_source.data["y"]] == [[5.0, 7.0], [6.0]]
+
+
+class TestPositionsInterpolation:
+    def test_interpolates_between_keyframes(self):
+        data = pd.DataFrame(
+            {"x": [1.0, 2.0, 3.0, 4.0], "y": [5.0, 6.0, 7.0, 8.0], "frame": [1, 1, 3, 3], "p": list("abba")}
+        )
+        animation = Animation("frame", 10, mode="view", interpolate=True, entity_mapping="p")
+        grid = (pt.PTPlot(data) + plot.Positions("x", "y", orientation="y", name="positions") + animation).draw()
+        (renderer,) = [
+            renderer for renderer in grid.children[1].children[0][0].renderers if renderer.name == "positions"
+        ]
+        # Interpolating always copies the data, even in view mode
+        assert renderer.view.filters == []
+        slider = grid.children[-1].children[1]
+        (callback,) = slider.js_property_callbacks["change:value"]
+        (args,) = callback.args["animations_0"]
+        np.testing.assert_array_equal(args["next_rows"].data["next"], [3, 2, -1, -1])
+        assert args["interpolated"] == ["x", "y"]
+        assert args["angles"] == ["y"]
+
+
+class TestFrameStore:
+    def test_layers_share_one_store_per_group(self):
+        data = pd.DataFrame(
+            {"x": [1.0, 2.0, 3.0, 4.0], "y": [5.0, 6.0, 7.0, 8.0], "frame": [2, 1, 1, 2], "p": list("abab")}
+        )
+        grid = (
+            pt.PTPlot(data) + plot.Tracks("x", "y", "p") + plot.Positions("x", "y") + Animation("frame", 10)
+        ).draw()
+        slider = grid.children[-1].children[1]
+        (callback,) = slider.js_property_callbacks["change:value"]
+        (tracks,) = callback.args["animations_0"]
+        (positions,) = callback.args["animations_1"]
+        assert tracks["full_source"] is positions["full_source"]
+        np.testing.assert_array_equal(positions["full_source"].data["p"], ["b", "a", "a", "b"])
+        # Track a, then track b
+        np.testing.assert_array_equal(tracks["track_rows"].data["rows"], [1, 2, 0, 3])
+        assert tracks["track_starts"] == [0, 2, 4]
+
+
+class TestPositionsWorkerMode:
+    def test_embeds_worker_only_when_used(self):
+        data = pd.DataFrame({"x": [1.0, 2.0], "y": [5.0, 6.0], "frame": [1, 2]})
+        for mode, uses_worker in [("worker", True), ("data", False)]:
+            grid = (pt.PTPlot(data) + plot.Positions("x", "y") + Animation("frame", 10, mode=mode)).draw()
+            slider = grid.children[-1].children[1]
+            (callback,) = slider.js_property_callbacks["change:value"]
+            (args,) = callback.args["animations_0"]
+            assert (callback.args["worker_code"] is not None) == uses_worker
+            assert ("next_rows" in args) == uses_worker
+            assert args["full_source"].data["frame"].tolist() == [1, 2]
+
+
+class TestPositionsViewMode:
+    @pytest.fixture(scope="function")
+    def input_data(self):
+        return pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0], "y": [5.0, 6.0, 7.0, 8.0], "frame": [2, 1, 2, 1]})
+
+    def _renderers(self, grid):
+        return [renderer for renderer in grid.children[1].children[0][0].renderers if renderer.name == "positions"]
+
+    def test_filters_a_single_source(self, input_data):
+        grid = (
+            pt.PTPlot(input_data)
+            + plot.Positions("x", "y", name="positions")
+            + Animation("frame", 10, mode="view")
+        ).draw()
+        (renderer,) = self._renderers(grid)
+        # Sorted by frame, with the sentinel row on the end
+        np.testing.assert_array_equal(renderer.data_source.data["frame"], [1, 1, 2, 2, 1])
+        assert np.isnan(renderer.data_source.data["x"][-1])
+        assert renderer.view.filters[0].indices == [0, 1, 4]
+
+    def test_data_mode_replaces_source_data(self, input_data):
+        grid = (pt.PTPlot(input_data) + plot.Positions("x", "y", name="positions") + Animation("frame", 10)).draw()
+        (renderer,) = self._renderers(grid)
+        np.testing.assert_array_equal(renderer.data_source.data["frame"], [1, 1])
+        assert renderer.view.filters == []
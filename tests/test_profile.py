@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+import ptplot.ptplot as pt
+from ptplot.animation import Animation
+from ptplot.core import Layer
+from ptplot.facet import Facet
+from ptplot.profile import profiling
+
+
+class AllocatingLayer(Layer):
+    def draw(self, ptplot, data, bokeh_figure, metadata):
+        bytearray(2 ** 20)
+
+
+@pytest.fixture(scope="function")
+def input_data():
+    return pd.DataFrame({"x": range(6), "frame": [1, 2, 3, 1, 2, 3], "facet": list("aaabbb")})
+
+
+class TestDrawProfile:
+    def test_draw_stores_report(self, input_data):
+        layer = AllocatingLayer()
+        plot = pt.PTPlot(input_data) + Facet("facet", num_col=1) + layer
+        plot.draw(profile=True)
+        report = plot.last_profile
+        assert report.total.calls == 1
+        assert list(report.phases) == ["mappings", "grouping", "figures", "layers", "layout"]
+        assert report.phases["figures"].calls == 2
+        layer_measurement = next(measurement for measurement in report.layers if measurement.layer is layer)
+        assert layer_measurement.calls == 2
+        assert layer_measurement.peak_memory >= 2 ** 20
+        assert report.phases["layers"].peak_memory >= 2 ** 20
+        assert report.total.peak_memory >= 2 ** 20
+
+    def test_context_manager_profiles_multiple_draws_and_calls_hook(self, input_data):
+        reports = []
+        with profiling(hook=reports.append, trace_memory=False) as report:
+            (pt.PTPlot(input_data) + AllocatingLayer()).draw()
+            (pt.PTPlot(input_data) + AllocatingLayer() + Animation("frame", 10)).draw()
+        assert reports == [report]
+        assert report.total.calls == 2
+        assert report.phases["animation"].calls == 1
+        assert len(report.layers) == 3
+        assert all(record["peak_memory"] is None for record in report.to_records())
+
+    def test_does_not_profile_by_default(self, input_data):
+        plot = pt.PTPlot(input_data) + AllocatingLayer()
+        plot.draw()
+        assert plot.last_profile is None
+
+    def test_records_incremental_draws(self, input_data):
+        plot = pt.PTPlot(input_data) + AllocatingLayer()
+        plot.draw()
+        new_layer = AllocatingLayer()
+        plot += new_layer
+        plot.draw(profile=True)
+        assert [measurement.layer for measurement in plot.last_profile.layers] == [new_layer]
@@ -1,8 +1,16 @@
+import numpy as np
 import pandas as pd
 import pytest
 
+from bokeh.core.validation import check_integrity
+from bokeh.models import Legend
+
 import ptplot.ptplot as pt
-from ptplot.core import Layer
+from ptplot.animation import Animation
+from ptplot.core import Layer, _Aesthetics
+from ptplot.facet import Facet
+from ptplot.nfl import Field
+from ptplot.plot import Positions, Tracks
 
 
 class TestFacetLayer:
@@ -114,4 +122,186 @@ class TestInternalApplyMapping:
         arithmetic = "Q('one + two') + 6"
         expected = pd.Series([13., 14., 15.], name=arithmetic)
         actual = pt._apply_mapping(input_data, arithmetic)
-        pd.testing.assert_series_equal(expected, actual)
\ No newline at end of file
+        pd.testing.assert_series_equal(expected, actual)
+
+    def test_uses_read_only_view_when_not_copying(self, input_data):
+        mapped_data = pt._apply_mapping(input_data, "b", copy=False)
+        assert np.shares_memory(mapped_data.to_numpy(), input_data["b"].to_numpy())
+        with pytest.raises(ValueError, match="read-only"):
+            mapped_data[0] = 999
+        pd.testing.assert_frame_equal(input_data, pd.DataFrame({
+            "a": [1, 2, 3, 4, 5],
+            "b": [6, 7, 8, 9, 10]
+        }))
+
+    def test_expression_is_computed_into_new_memory(self, input_data):
+        expected = pd.Series([6., 14., 24., 36., 50.], name="a * b")
+        actual = pt._apply_mapping(input_data, "a * b", copy=False)
+        assert not any(np.shares_memory(actual.to_numpy(), input_data[column].to_numpy()) for column in "ab")
+        pd.testing.assert_series_equal(expected, actual)
+
+
+class TestIncrementalDraw:
+    @pytest.fixture(scope="function")
+    def counting_layer(self):
+        class CountingLayer(Layer):
+            def __init__(self, mapping):
+                self.mapping = mapping
+                self.drawn_data = []
+
+            def get_mappings(self):
+                return [self.mapping]
+
+            def draw(self, ptplot, data, bokeh_figure, metadata):
+                self.drawn_data.append(data)
+
+        return CountingLayer
+
+    @pytest.fixture(scope="function")
+    def input_data(self):
+        return pd.DataFrame({
+            "a": [1, 2, 3, 4],
+            "b": [5, 6, 7, 8],
+            "facet": ["x", "y", "x", "y"],
+        })
+
+    def test_only_draws_new_layers(self, input_data, counting_layer):
+        first_layer = counting_layer("a")
+        plot = pt.PTPlot(input_data) + first_layer + Facet("facet")
+        first_grid = plot.draw()
+        second_layer = counting_layer("a")
+        second_grid = (plot + second_layer).draw()
+        assert second_grid is first_grid
+        assert len(first_layer.drawn_data) == 2
+        assert len(second_layer.drawn_data) == 2
+
+    def test_computes_new_mappings_for_new_layers(self, input_data, counting_layer):
+        plot = pt.PTPlot(input_data) + counting_layer("a") + Facet("facet")
+        plot.draw()
+        new_layer = counting_layer("a * b")
+        (plot + new_layer).draw()
+        expected = [pd.Series([5., 21.], name="a * b"), pd.Series([12., 32.], name="a * b")]
+        for facet_data, expected_data in zip(new_layer.drawn_data, expected):
+            pd.testing.assert_series_equal(facet_data["a * b"].reset_index(drop=True), expected_data)
+            assert facet_data["facet"].nunique() == 1
+
+    def test_redraws_everything_when_adding_structural_layer(self, input_data, counting_layer):
+        first_layer = counting_layer("a")
+        plot = pt.PTPlot(input_data) + first_layer
+        first_grid = plot.draw()
+        second_grid = (plot + Facet("facet")).draw()
+        assert second_grid is not first_grid
+        assert len(first_layer.drawn_data) == 3
+
+    def test_redraws_everything_when_data_changes(self, input_data, counting_layer):
+        first_layer = counting_layer("a")
+        plot = pt.PTPlot(input_data) + first_layer
+        first_grid = plot.draw()
+        plot.data = input_data.copy()
+        assert plot.draw() is not first_grid
+        assert len(first_layer.drawn_data) == 2
+
+    def test_redraws_everything_after_in_place_edits(self):
+        data = pd.DataFrame({"frame": [2, 1, 2, 1, 3]})
+        plot = pt.PTPlot(data) + Animation("frame", 10)
+        plot.draw()
+        data.loc[0, "frame"] = 0
+        grid = plot.draw()
+        assert grid.children[-1].children[1].start == 0
+
+
+class TestOutputBackend:
+    def test_figures_use_output_backend(self):
+        data = pd.DataFrame({"x": [1.0, 2.0], "y": [3.0, 4.0], "facet": ["a", "b"]})
+        grid = (pt.PTPlot(data, output_backend="webgl") + Positions("x", "y", orientation="x") + Facet("facet")).draw()
+        figures = [child[0] for child in grid.children[1].children]
+        assert len(figures) == 2
+        assert all(fig.output_backend == "webgl" for fig in figures)
+
+    def test_errors_with_unknown_backend(self):
+        with pytest.raises(ValueError):
+            pt.PTPlot(pd.DataFrame(), output_backend="opengl")
+
+
+class TestInternalRowOrder:
+    def test_skips_sort_when_already_ordered(self):
+        data = pd.DataFrame({"frame": [1, 1, 2, 3, 3], "facet": ["a", "a", "b", "b", "b"]})
+        plot = pt.PTPlot(data) + Facet("facet") + Animation("frame", 10)
+        assert plot._row_order(data) is None
+
+    def test_groups_by_facet_then_frame(self):
+        data = pd.DataFrame({"frame": [2, 1, 2, 1, 3], "facet": ["b", "a", "a", "b", "a"]})
+        plot = pt.PTPlot(data) + Facet("facet") + Animation("frame", 10)
+        # Facets are in order of first appearance once the data is in frame order
+        np.testing.assert_array_equal(plot._row_order(data), [1, 2, 4, 3, 0])
+
+
+class TestVectorizedAesthetics:
+    @pytest.fixture(scope="function")
+    def input_data(self):
+        return pd.DataFrame({
+            "frame": [2, 1, 1, 2, 1, 2],
+            "team": ["KC", "SF", "ball", "SF", "KC", "ball"],
+            "home": [True, False, None, False, True, None],
+            "player": [1, 2, 3, 2, 1, 3],
+            "x": [10.0, 20.0, 30.0, 21.0, 11.0, 31.0],
+            "y": [5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+        })
+
+    @pytest.fixture(scope="function")
+    def aesthetics(self):
+        class TestAesthetics(_Aesthetics):
+            team_color_mapping = {"KC": ("red", "gold"), "SF": ("maroon", "tan")}
+
+            def ball_marker_generator(figure):
+                return figure.circle
+
+        return TestAesthetics("team", "home", "ball", vectorize=True)
+
+    def test_all_players_in_one_group(self, input_data, aesthetics):
+        (players, player_metadata), (ball, ball_metadata) = aesthetics.map_aesthetics(input_data)
+        assert players["team"].tolist() == ["KC", "SF", "SF", "KC"]
+        assert ball["team"].tolist() == ["ball", "ball"]
+        assert list(players.columns) == list(input_data.columns)
+        assert len(ball_metadata.subgroups) == 0
+
+    def test_subgroups_match_unvectorized_groups(self, input_data, aesthetics):
+        (_, player_metadata), _ = aesthetics.map_aesthetics(input_data)
+        unvectorized = [
+            metadata
+            for _, metadata in _Aesthetics.map_aesthetics(
+                type(aesthetics)("team", "home", "ball"), input_data[input_data["team"] != "ball"]
+            )
+        ]
+        assert [(group.label, group.is_home, group.color_list) for group in player_metadata.subgroups] == [
+            (metadata.label, metadata.is_home, metadata.color_list) for metadata in unvectorized
+        ]
+
+    def test_draws_one_legend_item_per_team(self, input_data, aesthetics, caplog):
+        plot = (
+            pt.PTPlot(input_data)
+            + aesthetics
+            + Field()
+            + Tracks("x", "y", "player")
+            + Positions("x", "y", number="player")
+            + Animation("frame", 10)
+        )
+        grid = plot.draw()
+        check_integrity(grid.references())
+        assert not [record for record in caplog.records if record.levelname == "ERROR"]
+        legend = next(model for model in grid.references() if isinstance(model, Legend))
+        items = {item.label["value"]: item for item in legend.items}
+        assert sorted(items) == ["KC", "SF", "ball"]
+        for team in ["KC", "SF"]:
+            # One glyph per layer, each showing just the team's rows, so muting a team leaves the others alone
+            renderers = items[team].renderers
+            assert len(renderers) == 2
+            assert all(renderer.view.filters[0].args["team"] == team for renderer in renderers)
+        sources = {renderer.data_source.id for item in items.values() for renderer in item.renderers}
+        assert len(sources) == 4
+
+    def test_players_stay_in_frame_order(self, input_data, aesthetics):
+        plot = pt.PTPlot(input_data) + aesthetics + Animation("frame", 10)
+        ordered = input_data.take(plot._row_order(input_data))
+        assert ordered["frame"].tolist() == [1, 1, 2, 2, 1, 2]
+        assert ordered["team"].tolist()[-2:] == ["ball", "ball"]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pathlib import Path
+
+from bokeh.models import Legend
+
+from ptplot import PTPlot, testing
+from ptplot.nfl import NFL_TEAMS, Aesthetics
+from ptplot.plot import Positions
+
+
+class TestGenerateTrackingData:
+    @pytest.fixture(scope="function")
+    def data(self):
+        return testing.generate_tracking_data(num_games=2, num_plays=3, num_frames=50, seed=42)
+
+    def test_has_one_row_per_entity_per_frame(self, data):
+        assert len(data) == 2 * 3 * 23 * 50
+        rows_per_frame = data.groupby(["gameId", "playId", "frame"]).size()
+        assert (rows_per_frame == 23).all()
+        assert data["frame"].nunique() == 50
+
+    def test_matches_example_schema(self, data):
+        example = pd.read_csv(Path(__file__).parent.parent / "notebooks" / "2018_GB_2018090912_3564.tsv", sep="\t")
+        shared_columns = [column for column in data.columns if column != "time"]
+        assert set(shared_columns) <= set(example.columns)
+        for column in shared_columns:
+            assert data[column].dtype.kind == example[column].dtype.kind, column
+
+    def test_ball_is_named_like_example(self):
+        example = pd.read_csv(Path(__file__).parent.parent / "notebooks" / "2018_GB_2018090912_3564.tsv", sep="\t")
+        assert (example["displayName"] == testing.BALL_NAME).any()
+
+    def test_teams_are_consistent(self, data):
+        players = data[data["displayName"] != testing.BALL_NAME]
+        assert (players.groupby(["gameId", "playId", "teamAbbr"])["nflId"].nunique() == 11).all()
+        assert (players.groupby(["gameId", "teamAbbr"])["homeTeamFlag"].nunique() == 1).all()
+        assert (players.groupby(["gameId", "teamAbbr", "nflId"])["jerseyNumber"].nunique() == 1).all()
+        ball = data[data["displayName"] == testing.BALL_NAME]
+        assert ball[["teamAbbr", "homeTeamFlag", "jerseyNumber", "nflId", "o", "dir"]].isna().all().all()
+
+    def test_draws_every_team(self):
+        # Enough games for every team to play
+        data = testing.generate_tracking_data(num_games=len(testing.TEAMS) // 2, num_frames=1, seed=0)
+        assert set(testing.TEAMS) <= set(NFL_TEAMS)
+        grid = (PTPlot(data) + Aesthetics("teamAbbr", "homeTeamFlag == 1") + Positions("x", "y")).draw()
+        legend = next(model for model in grid.references() if isinstance(model, Legend))
+        assert sorted(item.label["value"] for item in legend.items) == sorted(testing.TEAMS)
+
+    def test_events_mark_whole_frames(self, data):
+        events = data.dropna(subset=["event"])
+        assert set(events["event"]) == {"ball_snap", "pass_forward", "pass_arrived", "tackle"}
+        assert (events.groupby(["gameId", "playId", "frame"]).size() == 23).all()
+
+    def test_is_reproducible_with_seed(self, data):
+        same = testing.generate_tracking_data(num_games=2, num_plays=3, num_frames=50, seed=42)
+        different = testing.generate_tracking_data(num_games=2, num_plays=3, num_frames=50, seed=43)
+        pd.testing.assert_frame_equal(data, same)
+        assert not np.allclose(data["x"], different["x"])
+
+    def test_short_plays(self):
+        data = testing.generate_tracking_data(num_frames=1, seed=0)
+        assert len(data) == 23
+
+    def test_rejects_empty_data(self):
+        with pytest.raises(ValueError):
+            testing.generate_tracking_data(num_plays=0)